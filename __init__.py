@@ -49,6 +49,7 @@ from string import Template
 from StringIO import StringIO
 import logging
 from time import time
+from types import GeneratorType
 
 # Copy our Version into the config so that our renders can access it
 conf["viur.version"] = __version__
@@ -184,7 +185,7 @@ def setDefaultDomainLanguage( domain, lang ):
 
 ### Multi-Language Part: END
 
-from server import session, errors
+from server import session, errors, db
 from server.tasks import TaskHandler, runStartupTasks
 
 try:
@@ -323,6 +324,72 @@ def buildApp( config, renderers, default=None, *args, **kwargs ):
 
 	return res
 
+class RoutingNode( object ):
+	"""
+		A node of the precompiled routing table of ``conf["viur.mainApp"]``.
+
+		Each node wraps one object reachable from the application-context (a module, a function, ...)
+		together with everything the request routing needs to know about it, so dispatching a request
+		is a dictionary walk instead of calling ``dir()`` several times per path segment.
+		Child nodes are created on first use and kept for the lifetime of the instance, up to
+		maxNodes nodes per table; private attributes (starting with "_") are never routed to.
+	"""
+	maxNodes = 1000 #Further nodes are built for the current request only, so random URLs can't grow the table
+
+	def __init__( self, target, root=None ):
+		super( RoutingNode, self ).__init__()
+		members = dir( target )
+		self.target = target
+		self.members = frozenset( members )
+		self.canAccess = target.canAccess if "canAccess" in self.members else None
+		self.isCallable = callable( target )
+		self.exposed = "exposed" in self.members and bool( target.exposed )
+		self.internalExposed = "internalExposed" in self.members and bool( target.internalExposed )
+		self.forceSSL = "forceSSL" in self.members and bool( target.forceSSL )
+		self.forcePost = "forcePost" in self.members and bool( target.forcePost )
+		self.children = {}
+		self.root = root or self
+		self.nodeCount = 1 #Nodes kept in this table, only maintained on its root
+
+	def isExposed( self, internalRequest ):
+		"""
+			Checks if the wrapped object can be called by a request.
+
+			:param internalRequest: Whether this is an internal request (by execRequest())
+			:type internalRequest: bool
+			:rtype: bool
+		"""
+		return( self.isCallable and ( self.exposed or ( self.internalExposed and internalRequest ) ) )
+
+	def getChild( self, name ):
+		"""
+			Returns the node for the attribute *name* of the wrapped object.
+
+			:returns: The node, or None if there is no such attribute.
+			:rtype: RoutingNode | None
+		"""
+		if name.startswith( "_" ) or not name in self.members:
+			return( None )
+		child = self.children.get( name )
+		if child is None:
+			child = RoutingNode( getattr( self.target, name ), self.root )
+			if self.root.nodeCount < self.maxNodes:
+				self.children[ name ] = child
+				self.root.nodeCount += 1
+		return( child )
+
+def getRoutingTable():
+	"""
+		Returns the root of the routing table for ``conf["viur.mainApp"]``.
+
+		It's built in :func:`setup`, and rebuilt if viur.mainApp has been replaced since.
+
+		:rtype: RoutingNode
+	"""
+	if conf["viur.mainAppRoutes"] is None or conf["viur.mainAppRoutes"].target is not conf["viur.mainApp"]:
+		conf["viur.mainAppRoutes"] = RoutingNode( conf["viur.mainApp"] )
+	return( conf["viur.mainAppRoutes"] )
+
 class BrowseHandler(webapp.RequestHandler):
 	"""
 		This class accepts the requests, collect its parameters and routes the request
@@ -521,6 +588,7 @@ class BrowseHandler(webapp.RequestHandler):
 				bugsnag.notify( e )
 		finally:
 			self.saveSession( )
+			db.flushAutoBatcher() # Send the calls still queued by the db module
 
 
 	def findAndCall( self, path, *args, **kwargs ): #Do the actual work: process the request
@@ -547,46 +615,44 @@ class BrowseHandler(webapp.RequestHandler):
 		#Parse the URL
 		path = urlparse.urlparse( path ).path
 		self.pathlist = [ urlparse.unquote( x ) for x in path.strip("/").split("/") ]
-		caller = conf["viur.mainApp"]
+		node = getRoutingTable()
 		idx = 0 #Count how may items from *args we'd have consumed (so the rest can go into *args of the called func
 		for currpath in self.pathlist:
-			if "canAccess" in dir( caller ) and not caller.canAccess():
+			if node.canAccess is not None and not node.canAccess():
 				# We have a canAccess function guarding that object,
 				# and it returns False...
 				raise( errors.Unauthorized() )
 			idx += 1
 			currpath = currpath.replace("-", "_").replace(".", "_")
-			if currpath in dir( caller ):
-				caller = getattr( caller,currpath )
-				if (("exposed" in dir( caller ) and caller.exposed) or ("internalExposed" in dir( caller ) and caller.internalExposed and self.internalRequest)) and hasattr(caller, '__call__'):
+			child = node.getChild( currpath )
+			if child is not None:
+				node = child
+				if node.isExposed( self.internalRequest ):
 					args = self.pathlist[ idx : ] + [ x for x in args ] #Prepend the rest of Path to args
 					break
-			elif "index" in dir( caller ):
-				caller = getattr( caller, "index" )
-				if (("exposed" in dir( caller ) and caller.exposed) or ("internalExposed" in dir( caller ) and caller.internalExposed and self.internalRequest)) and hasattr(caller, '__call__'):
+			elif node.getChild( "index" ) is not None:
+				node = node.getChild( "index" )
+				if node.isExposed( self.internalRequest ):
 					args = self.pathlist[ idx-1 : ] + [ x for x in args ]
 					break
 				else:
 					raise( errors.NotFound( "The path %s could not be found" % "/".join( [ ("".join([ y for y in x if y.lower() in "0123456789abcdefghijklmnopqrstuvwxyz"]) ) for x in self.pathlist[ : idx ] ] ) ) )
 			else:
 				raise( errors.NotFound( "The path %s could not be found" % "/".join( [ ("".join([ y for y in x if y.lower() in "0123456789abcdefghijklmnopqrstuvwxyz"]) ) for x in self.pathlist[ : idx ] ] ) ) )
-		if (not callable( caller ) or ((not "exposed" in dir( caller ) or not caller.exposed)) and (not "internalExposed" in dir( caller ) or not caller.internalExposed or not self.internalRequest)):
-			if "index" in dir( caller ) \
-				and (callable( caller.index ) \
-				and ( "exposed" in dir( caller.index ) and caller.index.exposed) \
-				or ("internalExposed" in dir( caller.index ) and caller.index.internalExposed and self.internalRequest)):
-					caller = caller.index
+		if not node.isExposed( self.internalRequest ):
+			if node.getChild( "index" ) is not None and node.getChild( "index" ).isExposed( self.internalRequest ):
+				node = node.getChild( "index" )
 			else:
 				raise( errors.MethodNotAllowed() )
+		caller = node.target
 		# Check for forceSSL flag
 		if not self.internalRequest \
-			and "forceSSL" in dir( caller ) \
-			and caller.forceSSL \
+			and node.forceSSL \
 			and not self.request.host_url.lower().startswith("https://") \
 			and not "Development" in os.environ['SERVER_SOFTWARE']:
 				raise( errors.PreconditionFailed("You must use SSL to access this ressource!") )
 		# Check for forcePost flag
-		if "forcePost" in dir( caller ) and caller.forcePost and not self.isPostRequest:
+		if node.forcePost and not self.isPostRequest:
 			raise( errors.MethodNotAllowed("You must use POST to access this ressource!") )
 		self.args = []
 		for arg in args:
@@ -609,7 +675,12 @@ class BrowseHandler(webapp.RequestHandler):
 		try:
 			if (conf["viur.debug.traceExternalCallRouting"] and not self.internalRequest) or conf["viur.debug.traceInternalCallRouting"]:
 				logging.debug("Calling %s with args=%s and kwargs=%s" % (str(caller),unicode(args), unicode(kwargs)))
-			self.response.out.write( caller( *self.args, **self.kwargs ) )
+			res = caller( *self.args, **self.kwargs )
+			if isinstance( res, GeneratorType ): # A streaming response (see viur.render.streamLists)
+				for chunk in res:
+					self.response.out.write( chunk )
+			else:
+				self.response.out.write( res )
 		except TypeError as e:
 			if self.internalRequest: #We provide that "service" only for requests originating from outside
 				raise
@@ -688,6 +759,7 @@ def setup( modules, render=None, default="html" ):
 		import server.render
 		render = server.render
 	conf["viur.mainApp"] = buildApp( modules, render, default )
+	conf["viur.mainAppRoutes"] = RoutingNode( conf["viur.mainApp"] )
 	renderPrefix = [ "/%s" % x for x in dir( render ) if (not x.startswith("_") and x!=default) ]+[""]
 	conf["viur.wsgiApp"] = webapp.WSGIApplication( [(r'/(.*)', BrowseHandler)] )
 	# Ensure that our Content Security Policy Header Cache gets build
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+	Micro-benchmark for rendering the values of skeletons with the json and html renders.
+
+	Renders 100 entries of a skeleton with 12 select (one of them multiple), 12 multi-language
+	string, one numeric and one multiple relational bone (three references each). Run it from your project's directory
+	(so *server* is importable), with the App Engine SDK and Jinja2 on your path::
+
+		python server/benchmarks/render.py
+
+	To compare two revisions, run it once for each of them.
+"""
+import os, sys, timeit
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) ) )
+
+from server.skeleton import BaseSkeleton, RefSkel
+from server.bones import stringBone, selectBone, relationalBone, numericBone
+from server.render.json.default import DefaultRender as JsonRender
+from server.render.html.default import Render as HtmlRender
+
+entryCount = 100
+runs = 50
+
+
+class DestSkel( BaseSkeleton ):
+	kindName = "benchmark-dest"
+	name = stringBone( descr="Name", languages=["de", "en"] )
+	color = selectBone( descr="Color", values={"r": "Red", "g": "Green"} )
+
+class BenchSkel( BaseSkeleton ):
+	kindName = "benchmark"
+	name = stringBone( descr="Name", languages=["de", "en"] )
+	descr = stringBone( descr="Description", languages=["de", "en"] )
+	status = selectBone( descr="Status", values={"a": "Active", "i": "Inactive"} )
+	tags = selectBone( descr="Tags", values={"x": "X", "y": "Y", "z": "Z"}, multiple=True )
+	price = numericBone( descr="Price" )
+
+for i in range( 10 ):
+	setattr( BenchSkel, "extra%d" % i, stringBone( descr="Extra", languages=["de", "en"] ) )
+	setattr( BenchSkel, "code%d" % i, selectBone( descr="Code", values={"a": "A", "b": "B"} ) )
+
+ref = relationalBone( kind="benchmark-dest", module="benchmark-dest", refKeys=["key", "name", "color"], multiple=True )
+# DestSkel isn't a registered Skeleton, so hand its RefSkel to that bone directly
+ref._refSkelCache = RefSkel.fromSkel( DestSkel, "key", "name", "color" )
+ref._usingSkelCache = None
+BenchSkel.ref = ref
+
+def buildEntry( i ):
+	res = {	"key": "key%d" % i, "name": {"de": "Name %d" % i, "en": "Name %d" % i},
+		"descr": {"de": "Beschreibung", "en": "Description"}, "status": "a", "tags": ["x", "z"], "price": i,
+		"ref": [ {"dest": {"key": "dest%d" % j, "name": {"de": "Ziel", "en": "Dest"}, "color": "r"}, "rel": None} for j in range( 3 ) ] }
+	for j in range( 10 ):
+		res[ "extra%d" % j ] = {"de": "Extra", "en": "Extra"}
+		res[ "code%d" % j ] = "b"
+	return( res )
+
+entries = [ buildEntry( i ) for i in range( entryCount ) ]
+skel = BenchSkel()
+jsonRender = JsonRender()
+htmlRender = HtmlRender()
+
+def renderJson():
+	for entry in entries:
+		skel.setValuesCache( entry )
+		jsonRender.renderSkelValues( skel )
+
+def renderHtml():
+	for entry in entries:
+		skel.setValuesCache( entry )
+		htmlRender.collectSkelData( skel )
+
+if __name__ == "__main__":
+	for name, func in [ ( "json renderSkelValues", renderJson ), ( "html collectSkelData", renderHtml ) ]:
+		best = min( timeit.repeat( func, number=runs, repeat=5 ) )
+		print( "%-22s %8.2f ms" % ( name, best / runs * 1e3 ) )
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+	Micro-benchmark for constructing skeletons and accessing their bones.
+
+	Run it from your project's directory (so *server* is importable), with the App Engine SDK
+	on your path::
+
+		python server/benchmarks/skeletons.py
+
+	To compare two revisions, run it once for each of them.
+"""
+import os, sys, timeit
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) ) )
+
+from server.skeleton import BaseSkeleton
+from server.bones import stringBone, numericBone
+
+boneCount = 40
+runs = 2000
+
+
+class BenchSkel( BaseSkeleton ):
+	kindName = "benchmark"
+
+bones = {}
+for i in range( boneCount ):
+	bones[ "bone%02d" % i ] = stringBone( descr="String %s" % i ) if i % 2 else numericBone( descr="Numeric %s" % i )
+	setattr( BenchSkel, "bone%02d" % i, bones[ "bone%02d" % i ] )
+
+skel = BenchSkel()
+
+def construct():
+	BenchSkel()
+
+def access():
+	for key in bones:
+		getattr( skel, key )
+
+def clone():
+	skel.clone()
+
+if __name__ == "__main__":
+	for name, func in [ ( "construction", construct ), ( "%s bone lookups" % boneCount, access ), ( "clone", clone ) ]:
+		best = min( timeit.repeat( func, number=runs, repeat=3 ) )
+		print( "%-20s %8.1f us" % ( name, best / runs * 1e6 ) )
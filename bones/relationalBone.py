@@ -43,6 +43,7 @@ class relationalBone( baseBone ):
 	parentKeys = ["key", "name"]
 	type = "relational"
 	kind = None
+	relationBatchSize = 500 # Max. amount of viur-relations entries written or deleted within one datastore call
 
 	def __init__(self, kind=None, module=None, refKeys=None, parentKeys=None, multiple=False,
 	             format="$(dest.name)", using=None, *args, **kwargs):
@@ -269,59 +270,75 @@ class relationalBone( baseBone ):
 		dbVals.filter("viur_dest_kind =", self.kind)
 		dbVals.filter("viur_src_property =", boneName )
 
+		# Map each referenced key to its values (the same entry might be referenced more than once)
+		valuesByKey = {}
+		for val in values:
+			valuesByKey.setdefault( val["dest"]["key"], [] ).append( val )
+
+		toPut = []
+		toDelete = []
 		for dbObj in dbVals.iter():
 			try:
-				if not dbObj[ "dest.key" ] in [ x["dest"]["key"] for x in values ]: #Relation has been removed
-					db.Delete( dbObj.key() )
-					continue
+				destKey = dbObj[ "dest.key" ]
 			except: #This entry is corrupt
-				db.Delete( dbObj.key() )
-			else: # Relation: Updated
-				data = [x for x in values if x["dest"]["key"] == dbObj["dest.key"]][0]
-				if self.indexed: #We dont store more than key and kinds, and these dont change
-					#Write our (updated) values in
-					refSkel = self._refSkelCache
-					refSkel.setValuesCache(data["dest"])
-					for k, v in refSkel.serialize().items():
-						dbObj[ "dest."+k ] = v
-					for k,v in parentValues.items():
-						dbObj[ "src."+k ] = v
-					if self.using is not None:
-						usingSkel = self._usingSkelCache
-						usingSkel.setValuesCache(data["rel"])
-						for k, v in usingSkel.serialize().items():
-							dbObj[ "rel."+k ] = v
-					dbObj[ "viur_delayed_update_tag" ] = time()
-					db.Put( dbObj )
-				values.remove( data )
+				toDelete.append( dbObj.key() )
+				continue
+			if not valuesByKey.get( destKey ): #Relation has been removed
+				toDelete.append( dbObj.key() )
+				continue
+			# Relation: Updated
+			data = valuesByKey[ destKey ].pop( 0 )
+			if self.indexed: #We dont store more than key and kinds, and these dont change
+				#Write our (updated) values in
+				dbObj = db.Entity.FromDatastoreEntity( dbObj ) # Query results are plain datastore.Entity objects
+				self._writeRelationData( dbObj, data, parentValues )
+				toPut.append( dbObj )
 
 		# Add any new Relation
-		for val in values:
-			dbObj = db.Entity( "viur-relations" , parent=db.Key( key ) ) #skel.kindName+"_"+self.kind+"_"+key
+		for valList in valuesByKey.values():
+			for val in valList:
+				dbObj = db.Entity( "viur-relations" , parent=db.Key( key ) ) #skel.kindName+"_"+self.kind+"_"+key
 
-			if not self.indexed: #Dont store more than key and kinds, as they aren't used anyway
-				dbObj[ "dest.key" ] = val["dest"]["key"]
-				dbObj[ "src.key" ] = key
-			else:
-				refSkel = self._refSkelCache
-				refSkel.setValuesCache(val["dest"])
-				for k, v in refSkel.serialize().items():
-					dbObj[ "dest."+k ] = v
-				for k,v in parentValues.items():
-					dbObj[ "src."+k ] = v
-				if self.using is not None:
-					usingSkel = self._usingSkelCache
-					usingSkel.setValuesCache(val["rel"])
-					for k, v in usingSkel.serialize().items():
-						dbObj[ "rel."+k ] = v
-
-			dbObj[ "viur_delayed_update_tag" ] = time()
-			dbObj[ "viur_src_kind" ] = skel.kindName #The kind of the entry referencing
-			#dbObj[ "viur_src_key" ] = str( key ) #The key of the entry referencing
-			dbObj[ "viur_src_property" ] = boneName #The key of the bone referencing
-			#dbObj[ "viur_dest_key" ] = val["key"]
-			dbObj[ "viur_dest_kind" ] = self.kind
-			db.Put( dbObj )
+				if not self.indexed: #Dont store more than key and kinds, as they aren't used anyway
+					dbObj[ "dest.key" ] = val["dest"]["key"]
+					dbObj[ "src.key" ] = key
+					dbObj[ "viur_delayed_update_tag" ] = time()
+				else:
+					self._writeRelationData( dbObj, val, parentValues )
+
+				dbObj[ "viur_src_kind" ] = skel.kindName #The kind of the entry referencing
+				#dbObj[ "viur_src_key" ] = str( key ) #The key of the entry referencing
+				dbObj[ "viur_src_property" ] = boneName #The key of the bone referencing
+				#dbObj[ "viur_dest_key" ] = val["key"]
+				dbObj[ "viur_dest_kind" ] = self.kind
+				toPut.append( dbObj )
+
+		# Flush all changes in batches, running puts and deletes in parallel
+		rpcs = []
+		for i in range( 0, len( toPut ), self.relationBatchSize ):
+			rpcs.append( db.PutAsync( toPut[ i: i+self.relationBatchSize ] ) )
+		for i in range( 0, len( toDelete ), self.relationBatchSize ):
+			rpcs.append( db.DeleteAsync( toDelete[ i: i+self.relationBatchSize ] ) )
+		for rpc in rpcs:
+			rpc.get_result()
+
+	def _writeRelationData( self, dbObj, data, parentValues ):
+		"""
+			Writes the values of a single relation (its referenced entry, our parentKeys and
+			the values of its usingSkel) into the given viur-relations entity.
+		"""
+		refSkel = self._refSkelCache
+		refSkel.setValuesCache(data["dest"])
+		for k, v in refSkel.serialize().items():
+			dbObj[ "dest."+k ] = v
+		for k,v in parentValues.items():
+			dbObj[ "src."+k ] = v
+		if self.using is not None:
+			usingSkel = self._usingSkelCache
+			usingSkel.setValuesCache(data["rel"])
+			for k, v in usingSkel.serialize().items():
+				dbObj[ "rel."+k ] = v
+		dbObj[ "viur_delayed_update_tag" ] = time()
 
 	def postDeletedHandler( self, skel, key, id ):
 		db.Delete( [x for x in db.Query( "viur-relations" ).ancestor( db.Key( id ) ).run( keysOnly=True ) ] )
@@ -394,15 +411,28 @@ class relationalBone( baseBone ):
 		forceFail = False
 		if not tmpList and self.required:
 			return "No value selected!"
+		# Fetch all referenced entities at once
+		dbKeys = {}
+		for r in tmpList:
+			if not isinstance( r["dest"]["key"], basestring ): #Ie. a list, if that parameter has been repeated
+				continue
+			try:
+				dbKeys[ r["dest"]["key"] ] = db.Key( r["dest"]["key"] )
+			except: #Invalid key or something like that
+				pass
+		entries = {}
+		if dbKeys:
+			for entry in db.Get( list( set( dbKeys.values() ) ) ):
+				if entry:
+					entries[ str( entry.key() ) ] = entry
 		for r in tmpList[:]:
 			# Rebuild the referenced entity data
 			isEntryFromBackup = False #If the referenced entry has been deleted, restore information from
 			entry = None
 
-			try:
-				entry = db.Get( db.Key( r["dest"]["key"] ) )
-			except: #Invalid key or something like thatmnn
-
+			if isinstance( r["dest"]["key"], basestring ) and r["dest"]["key"] in dbKeys:
+				entry = entries.get( str( dbKeys[ r["dest"]["key"] ] ) )
+			if entry is None: #Invalid key or the entry has been deleted
 				logging.info( "Invalid reference key >%s< detected on bone '%s'",
 							  r["dest"]["key"], name )
 				if isinstance(oldValues, dict):
@@ -534,7 +564,7 @@ class relationalBone( baseBone ):
 			if dbFilter.getKind()!="viur-relations" and self.multiple:
 				name, skel, dbFilter, rawFilter = self._rewriteQuery( name, skel, dbFilter, rawFilter )
 
-			relSkel = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
+			relSkel = self._refSkelCache or RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
 
 			# Merge the relational filters in
 			for myKey in myKeys:
@@ -722,9 +752,34 @@ class relationalBone( baseBone ):
 						res.append( "src.%s" % orderKey )
 		return( res )
 
+	def getReferencedKeys(self, valuesCache, boneName):
+		"""
+			Returns the (normalized) keys of all entities referenced by this bone.
+
+			:rtype: list of str
+		"""
+		if not valuesCache.get(boneName):
+			return []
+		if isinstance(valuesCache[boneName], dict):
+			values = [valuesCache[boneName]]
+		else:
+			values = valuesCache[boneName]
+		res = []
+		for relDict in values:
+			if isinstance(relDict, dict) and isinstance(relDict.get("dest"), dict) and relDict["dest"].get("key"):
+				try:
+					res.append(normalizeKey(relDict["dest"]["key"]))
+				except: #Invalid key
+					continue
+		return res
+
 	def refresh(self, valuesCache, boneName, skel):
 		"""
 			Refresh all values we might have cached from other entities.
+
+			All referenced entities are fetched in one batch. As they are fetched through :func:`server.db.Get`,
+			entities prefetched for a whole chunk of skeletons (see :func:`server.skeleton.prefetchReferencedEntities`)
+			are served from the per-request cache.
 		"""
 		def updateInplace(relDict):
 			"""
@@ -751,23 +806,13 @@ class relationalBone( baseBone ):
 			# Try to update referenced values;
 			# If the entity does not exist with this key, ignore
 			# (key was overidden above to have a new appid when transferred).
-			newValues = None
-
-			try:
-				newValues = db.Get(entityKey)
-				assert newValues is not None
-			except db.EntityNotFoundError:
+			newValues = entities.get(entityKey)
+			if newValues is None:
 				#This entity has been deleted
 				logging.info("The key %s does not exist" % entityKey)
-			except:
-				raise
 
 			if newValues:
-				for key in self._refSkelCache.keys():
-					if key == "key":
-						continue
-					elif key in newValues:
-						getattr(self._refSkelCache, key).unserialize(valDict, key, newValues)
+				self._updateDestValues(valDict, newValues)
 
 
 		if not valuesCache[boneName]:
@@ -775,6 +820,13 @@ class relationalBone( baseBone ):
 
 		logging.info("Refreshing relationalBone %s of %s" % (boneName, skel.kindName))
 
+		entities = {}
+		referencedKeys = list(set(self.getReferencedKeys(valuesCache, boneName)))
+		if referencedKeys:
+			for entity in db.Get(referencedKeys):
+				if entity:
+					entities[str(entity.key())] = entity
+
 		if isinstance(valuesCache[boneName], dict):
 			updateInplace(valuesCache[boneName])
 
@@ -782,6 +834,54 @@ class relationalBone( baseBone ):
 			for k in valuesCache[boneName]:
 				updateInplace(k)
 
+	def _updateDestValues(self, valDict, entity):
+		"""
+			Copies the values of our refKeys from *entity* into the dest-dictionary *valDict*.
+		"""
+		for key in self._refSkelCache.keys():
+			if key == "key":
+				continue
+			elif key in entity:
+				getattr(self._refSkelCache, key).unserialize(valDict, key, entity)
+
+	def updateReferencedValues(self, valuesCache, boneName, entity):
+		"""
+			Updates the values copied from *entity* into each reference of this bone pointing to it.
+
+			Unlike :meth:`refresh`, this doesn't fetch anything from the datastore; it's used to propagate
+			the changes of a single entity to all entities referencing it.
+
+			:param entity: The referenced entity, as fetched from the datastore.
+			:type entity: server.db.Entity
+
+			:returns: True if at least one of these values has changed, False otherwise.
+			:rtype: bool
+		"""
+		if not valuesCache.get(boneName):
+			return False
+		if isinstance(valuesCache[boneName], dict):
+			values = [valuesCache[boneName]]
+		else:
+			values = valuesCache[boneName]
+		entityKey = str(entity.key())
+		refSkel = self._refSkelCache
+		changed = False
+		for relDict in values:
+			if not isinstance(relDict, dict) or not relDict.get("dest") or not relDict["dest"].get("key"):
+				continue
+			try:
+				if normalizeKey(relDict["dest"]["key"]) != entityKey:
+					continue
+			except: #Invalid key
+				continue
+			refSkel.setValuesCache(relDict["dest"])
+			oldValues = refSkel.serialize()
+			self._updateDestValues(relDict["dest"], entity)
+			refSkel.setValuesCache(relDict["dest"])
+			if refSkel.serialize() != oldValues:
+				changed = True
+		return changed
+
 	def getSearchTags(self, values, key):
 		def getValues(res, skel, valuesCache):
 			for k, bone in skel.items():
@@ -858,19 +958,27 @@ class relationalBone( baseBone ):
 			:rtype: bool
 		"""
 		from server.skeleton import RefSkel, skeletonByKind
-		def relSkelFromKey(key):
-			if not isinstance(key, db.Key):
-				key = db.Key(encoded=key)
-			if not key.kind() == self.kind:
-				logging.error("I got a key, which kind doesn't match my type! (Got: %s, my type %s)" % (key.kind(), self.kind))
-				return None
-			entity = db.Get(key)
-			if not entity:
-				logging.error("Key %s not found" % str(key))
-				return None
-			relSkel = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
-			relSkel.unserialize(entity)
-			return relSkel
+		def relSkelsFromKeys(keys):
+			"""
+				Builds a RefSkel for each of the given keys, fetching all entities in one batch.
+				Returns None if any of these keys is invalid or doesn't exist.
+			"""
+			keys = [key if isinstance(key, db.Key) else db.Key(encoded=key) for key in keys]
+			for key in keys:
+				if not key.kind() == self.kind:
+					logging.error("I got a key, which kind doesn't match my type! (Got: %s, my type %s)" % (key.kind(), self.kind))
+					return None
+			entities = {str(entity.key()): entity for entity in db.Get(keys) if entity}
+			res = []
+			for key in keys:
+				entity = entities.get(str(key))
+				if not entity:
+					logging.error("Key %s not found" % str(key))
+					return None
+				relSkel = RefSkel.fromSkel(skeletonByKind(self.kind), *self.refKeys)
+				relSkel.unserialize(entity)
+				res.append(relSkel)
+			return res
 		if append and not self.multiple:
 			raise ValueError("Bone %s is not multiple, cannot append!" % boneName)
 		if not self.multiple and not self.using:
@@ -904,16 +1012,16 @@ class relationalBone( baseBone ):
 			else:
 				realValue = value
 		if not self.multiple:
-			relSkel = relSkelFromKey(realValue[0])
-			if not relSkel:
+			relSkels = relSkelsFromKeys([realValue[0]])
+			if not relSkels:
 				return False
-			valuesCache[boneName] = {"dest": relSkel.getValuesCache(), "rel": realValue[1].getValuesCache() if realValue[1] else None}
+			valuesCache[boneName] = {"dest": relSkels[0].getValuesCache(), "rel": realValue[1].getValuesCache() if realValue[1] else None}
 		else:
+			relSkels = relSkelsFromKeys([val[0] for val in realValue])
+			if relSkels is None:
+				return False
 			tmpRes = []
-			for val in realValue:
-				relSkel = relSkelFromKey(val[0])
-				if not relSkel:
-					return False
+			for val, relSkel in zip(realValue, relSkels):
 				tmpRes.append({"dest": relSkel.getValuesCache(), "rel": val[1].getValuesCache() if val[1] else None})
 			if append:
 				if not isinstance(valuesCache[boneName], list):
@@ -4,6 +4,7 @@ from math import pow, floor, ceil
 from server import db
 import logging
 import math
+import heapq
 
 def haversine(lat1, lng1, lat2, lng2):
 	"""
@@ -201,6 +202,7 @@ class spatialBone( baseBone ):
 
 			dbFilter._customMultiQueryMerge = lambda *args, **kwargs: self.customMultiQueryMerge( name, lat, lng, *args, **kwargs )
 			dbFilter._calculateInternalMultiQueryAmount = self.calculateInternalMultiQueryAmount
+			dbFilter._customMultiQueryCursors = True
 
 
 		#return( super( spatialBone, self ).buildDBFilter( name, skel, dbFilter, rawFilter ) )
@@ -252,7 +254,12 @@ class spatialBone( baseBone ):
 		tmpDict = {}
 		for item in (latRight+latLeft+lngBottom+lngTop):
 			tmpDict[str(item.key())] = item
-		# Build up the final results
-		tmpList = [(haversine(x[name+".lat.val"],x[name+".lng.val"],lat,lng),x) for x in tmpDict.values()]
-		tmpList.sort( key=lambda x: x[0])
-		return [x[1] for x in tmpList[:targetAmount]]
+		# Build up the final results; we just need the targetAmount nearest ones in order
+		candidates = ((haversine(x[name+".lat.val"],x[name+".lng.val"],lat,lng),key,x) for key, x in tmpDict.items())
+		if dbFilter._multiQueryMergeState: # Skip what we've returned on previous pages
+			lastDistance, lastKey = dbFilter._multiQueryMergeState
+			candidates = (x for x in candidates if (x[0], x[1]) > (lastDistance, lastKey))
+		tmpList = heapq.nsmallest( targetAmount, candidates )
+		if tmpList: # Remember where this page ended for its cursor
+			dbFilter._multiQueryMergeState = [tmpList[-1][0], tmpList[-1][1]]
+		return [x[2] for x in tmpList]
@@ -5,6 +5,7 @@ from hashlib import sha512
 from datetime import datetime, timedelta
 import logging
 from functools import wraps
+from types import GeneratorType
 
 """
 	This module provides a cache, allowing to serve
@@ -141,6 +142,8 @@ def wrapCallable(f, urls, userSensitive, languageSensitive, evaluatedArgs, maxCa
 				return( dbRes["data"] )
 		# If we made it this far, the request wasnt cached or too old; we need to rebuild it
 		res = f( self, *args, **kwargs )
+		if isinstance( res, GeneratorType ): # We can't store a streaming response
+			res = "".join( res )
 		dbEntity = db.Entity( viurCacheName, name=key )
 		dbEntity[ "data" ] = res
 		dbEntity[ "creationtime" ] = datetime.now()
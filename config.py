@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
-from datetime import datetime, timedelta
-from google.appengine.ext import db
-from google.appengine.api import memcache
-import sys
+from datetime import timedelta
+from time import time
+from google.appengine.api import memcache, datastore, datastore_errors
+import sys, logging
 
 apiVersion = 1 #What format do we use to store data in the bigtable
 
@@ -19,6 +19,8 @@ conf = {
 	"viur.contentSecurityPolicy": None, #If set, viur will emit a CSP http-header with each request. Use the csp module to set this property
 
 	"viur.db.caching" : 2, #Cache strategy used by the database. 2: Aggressive, 1: Safe, 0: Off
+	"viur.db.autoBatch": False, #If set, Gets and Puts issued during a request are queued and sent together (see server.db.AutoBatcher)
+	"viur.db.queryCacheTime": 0, #If set (and viur.db.caching is 2), results of non-multi queries are cached for that many seconds. Any write to a kind invalidates its cached results.
 	"viur.debug.traceExceptions": False, #If enabled, user-generated exceptions from the server.errors module won't be caught and handled
 	"viur.debug.traceExternalCallRouting": False, #If enabled, ViUR will log which (exposed) function are called from outside with what arguments
 	"viur.debug.traceInternalCallRouting": False, #If enabled, ViUR will log which (internal-exposed) function are called from templates with what arguments
@@ -45,12 +47,15 @@ conf = {
 	"viur.logMissingTranslations": False, #If true, ViUR will log missing translations in the datastore
 
 	"viur.mainApp": None,  #Reference to our pre-build Application-Instance
+	"viur.mainAppRoutes": None,  #Precompiled routing table for viur.mainApp (see server.RoutingNode)
 	"viur.maxPasswordLength": 512, #Prevent Denial of Service attacks using large inputs for pbkdf2
 	"viur.maxPostParamsCount": 250, #Upper limit of the amount of parameters we accept per request. Prevents Hash-Collision-Attacks
 	"viur.skeletons": None, #Dictionary of all models known to this instance
 
 	"viur.noSSLCheckUrls": ["/_tasks*", "/ah/*"], #List of Urls for which viur.forceSSL is ignored. Add an asterisk to mark that entry as a prefix (exact match otherwise)
 
+	"viur.render.html.bytecodeCache": None, #Jinja2 bytecode cache shared by all html renders (see server.render.html.bytecodecache). Compiled templates are kept in memory if not set
+	"viur.render.streamLists": False, #If set, list() of the html, json and xml renders returns a generator and the response is written in chunks (except for internal requests)
 	"viur.requestPreprocessor": None, # Allows the application to register a function that's called before the request gets routed
 
 	"viur.salt": "ViUR-CMS",  #Default salt which will be used for eg. passwords. Once the application is used, this must not change!
@@ -70,6 +75,7 @@ conf = {
 	"viur.session.lifeTime": 60*60, #Default is 60 minutes lifetime for ViUR sessions
 	"viur.session.persistentFieldsOnLogin": [], #If set, these Fields will survive the session.reset() called on user/login
 	"viur.session.persistentFieldsOnLogout": [], #If set, these Fields will survive the session.reset() called on user/logout
+	"viur.session.store": None, #If set, sessions are kept in this server.session.SessionStore instead of memcache (written through to the datastore)
 
 	"viur.tasks.customEnvironmentHandler": None, #If set, must be a tuple of two functions serializing/restoring additional enviromental data in deferred requests,
 
@@ -84,57 +90,104 @@ class SharedConf():
 		The *SharedConf* is shared between **ALL** instances of the application.
 
 		For access, the singleton ``sharedConf`` should be used instead of instancing this class.
-		It takes up to 60 Seconds before changes get visible on all instances.
+		Each instance checks a generation counter in memcache every few seconds (see *checkInterval*),
+		and reloads the config only if it has been changed. If memcache has been flushed, it
+		takes up to 60 Seconds before changes get visible on all instances.
 
 		:warning: Changes here are replicated between **ALL** instances!\
 		Don't use this feature for real-time, high-traffic inter-instance communication.
 	"""
-	class SharedConfData( db.Expando ): # DB-Representation
-		pass
-
 	data = {
 		"viur.disabled": False,
 		"viur.apiVersion": apiVersion
 	}
 
-	ctime = datetime(2000, 1, 1, 0, 0, 0)
-	updateInterval = timedelta(seconds=60) #Every 60 Secs
+	checkInterval = 5 #Seconds between two checks of the generation counter
+	updateInterval = timedelta(seconds=60) #Reload every 60 Secs if the generation counter is missing
 	keyName = "viur-sharedconf"
+	generationKeyName = "viur-sharedconf-generation"
+	kindName = "SharedConfData"
 
 	def __init__(self):
+		self.subscribers = {}
+		self.generation = None #Generation of the config we've loaded
+		self.loadTime = 0 #When we've loaded it
+		self.nextCheck = 0 #When we'll look at the generation counter again
 		disabled = self["viur.disabled"] #Read the config if it exists
 
 	def __getitem__(self, key):
-		currTime = datetime.now()
-		if currTime>self.ctime+self.updateInterval:
-			data = memcache.get( self.keyName )
-			if data: #Loaded successfully from Memcache
-				self.data.update( data )
-				self.ctime = currTime
-			else:
-				data = SharedConf.SharedConfData.get_by_key_name( self.keyName )
-				if data:
-					for k in data.dynamic_properties():
-						self.data[ k ] = getattr( data, k )
-				else: #There isnt any config in the db nor the memcache
-					data = SharedConf.SharedConfData( key_name=self.keyName )
-					for k,v in self.data.items(): #Initialize the DB-Config
-						setattr( data, k, v )
-					data.put()
-				memcache.set( self.keyName, self.data, 60*60*24 )
+		if time() > self.nextCheck:
+			self.refresh()
 		return( self.data[ key ] )
 
 	def __setitem__(self, key, value ):
 		self.data[ key ] = value
+		try:
+			entity = datastore.Get( datastore.Key.from_path( self.kindName, self.keyName ) )
+			entity[ key ] = value
+		except datastore_errors.EntityNotFoundError: #Initialize the DB-Config
+			entity = datastore.Entity( self.kindName, name=self.keyName )
+			for k, v in self.data.items():
+				entity[ k ] = v
+		datastore.Put( entity )
 		memcache.set( self.keyName, self.data, 60*60*24 )
-		data = SharedConf.SharedConfData.get_by_key_name( self.keyName )
+		#Tell the other instances; a counter lost from memcache restarts at the current time, so old generations aren't reused
+		memcache.incr( self.generationKeyName, initial_value=long( time()*1000 ) )
+		self.notifySubscribers( key, value )
+
+	def refresh(self):
+		"""
+			Reloads the config if it has been changed since we've loaded it.
+		"""
+		now = time()
+		self.nextCheck = now + self.checkInterval
+		generation = memcache.get( self.generationKeyName )
+		if generation is None:
+			if self.loadTime and now < self.loadTime + self.updateInterval.seconds:
+				return
+			generation = long( now*1000 ) #Can't repeat a generation seen before memcache has been flushed
+			if not memcache.add( self.generationKeyName, generation ):
+				generation = memcache.get( self.generationKeyName ) #Someone else has been faster
+		elif generation == self.generation:
+			return
+		self.generation = generation
+		self.loadTime = now
+		data = memcache.get( self.keyName )
 		if not data:
-			data = SharedConf.SharedConfData( key_name=self.keyName )
-			for k,v in self.data.items(): #Initialize the DB-Config
-				setattr( data, k, v )
-		else:
-			setattr( data, key, value )
-		data.put()
+			try:
+				data = dict( datastore.Get( datastore.Key.from_path( self.kindName, self.keyName ) ) )
+			except datastore_errors.EntityNotFoundError: #There isnt any config in the db nor the memcache
+				entity = datastore.Entity( self.kindName, name=self.keyName )
+				for k, v in self.data.items():
+					entity[ k ] = v
+				datastore.Put( entity )
+				data = dict( self.data )
+			memcache.set( self.keyName, data, 60*60*24 )
+		changed = [ k for k, v in data.items() if k not in self.data or self.data[ k ] != v ]
+		self.data.update( data )
+		for k in changed:
+			self.notifySubscribers( k, data[ k ] )
+
+	def subscribe(self, key, callback):
+		"""
+			Registers *callback* to be called as callback( key, value ) each time *key* changes.
+
+			Changes made on other instances are noticed on the first access to the config after
+			they've been made (but at most every *checkInterval* seconds).
+
+			:param key: Name of the config value to watch.
+			:type key: str
+			:param callback: Callable taking the key and its new value.
+			:type callback: callable
+		"""
+		self.subscribers.setdefault( key, [] ).append( callback )
+
+	def notifySubscribers(self, key, value):
+		for callback in self.subscribers.get( key, [] ):
+			try:
+				callback( key, value )
+			except Exception as e:
+				logging.exception( e )
 
 
 if "viur_doc_build" in dir(sys):
@@ -4,7 +4,11 @@ from google.appengine.datastore import datastore_query, datastore_rpc
 from google.appengine.api import memcache
 from google.appengine.api import search
 from server.config import conf
-import logging
+from server import request
+from hashlib import sha256
+from time import time
+from collections import OrderedDict
+import logging, json, base64, threading
 
 
 """
@@ -18,11 +22,412 @@ import logging
 
 __cacheLockTime__ = 42 #Prevent an entity from creeping into the cache for 42 Secs if it just has been altered.
 __cacheTime__ = 15*60 #15 Mins
+__negativeCacheTime__ = 60 #Remember for 1 Min that a key does not exist
+__NegativeCacheMarker__ = "viur-db-cache:missing" #Stored in memcache instead of an entity if that key does not exist
 __CacheKeyPrefix__ ="viur-db-cache:" #Our Memcache-Namespace. Dont use that for other purposes
 __MemCacheBatchSize__ = 30
+__RequestCacheKey__ = "viur-db-cache" #Key of our per-request (L1) cache in request.current.requestData()
+__RequestCacheSize__ = 1000 #Max. amount of entities kept in the per-request cache
+__QueryCacheKeyPrefix__ = "viur-db-querycache:" #Memcache-Namespace for cached query results
+__QueryGenerationKeyPrefix__ = "viur-db-querygen:" #Memcache-Namespace for the per-kind generation counters
+__AutoBatcherKey__ = "viur-db-autobatcher" #Key of the AutoBatcher in request.current.requestData()
+__MaxPutBatchSize__ = 500 #Max. amount of entities written by one datastore Put
 __undefinedC__ = object()
+__transactionKinds__ = threading.local() #Kinds written by the transaction currently running in this thread
 
 
+def _getRequestCache():
+	"""
+		Returns the per-request (L1) entity cache.
+
+		Entities fetched during the current request are kept in this dictionary, so repeated
+		Gets of the same key are served without even asking memcache. Keys known not to exist
+		are mapped to None. It's dropped together with the request
+		(see :func:`server.request.RequestWrapper.setRequest`), and holds at most
+		__RequestCacheSize__ entities (see :func:`_fillRequestCache`).
+
+		:returns: The cache dictionary, or None if no request is bound to this thread.
+		:rtype: dict | None
+	"""
+	try:
+		reqData = request.current.requestData()
+	except AttributeError: # There's no request (yet)
+		return( None )
+	if not __RequestCacheKey__ in reqData:
+		reqData[ __RequestCacheKey__ ] = OrderedDict()
+	return( reqData[ __RequestCacheKey__ ] )
+
+def _fillRequestCache( reqCache, entities ):
+	"""
+		Stores *entities* in the per-request cache, evicting the oldest entries if it grows
+		beyond __RequestCacheSize__ entities (long running tasks might fetch a lot of them).
+
+		:param entities: Dictionary mapping the string representation of keys to their entity (or None)
+		:type entities: dict
+	"""
+	for strKey, entity in entities.items():
+		reqCache.pop( strKey, None )
+		reqCache[ strKey ] = entity
+	while len( reqCache ) > __RequestCacheSize__:
+		reqCache.popitem( last=False )
+
+def _invalidateCache( keys ):
+	"""
+		Removes the given keys (including negative entries) from both cache tiers.
+
+		The keys are also locked in memcache for __cacheLockTime__ seconds, so they won't
+		creep back into the cache while the datastore is still applying the change.
+		This works as we only fill the cache using add(), which fails for locked keys.
+
+		:param keys: List of keys (or their string representation) which have been altered.
+		:type keys: list of Key | list of str
+	"""
+	keys = [ str( x ) for x in keys ]
+	if not keys:
+		return
+	reqCache = _getRequestCache()
+	if reqCache is not None:
+		for key in keys:
+			reqCache.pop( key, None )
+	memcache.delete_multi( keys, seconds=__cacheLockTime__, namespace=__CacheKeyPrefix__ )
+
+def _startCachedGet( keys, **kwargs ):
+	"""
+		First half of a cached Get: Looks up *keys* in the per-request cache, then in memcache
+		and issues an asynchronous datastore Get for everything left.
+
+		:param keys: List of keys to fetch
+		:type keys: list of Key | list of str
+
+		:returns: A tuple of (found, rpc), where found is a dictionary mapping the string representation
+			of each key found in one of the caches to its entity (or None if its known to be missing),
+			and rpc the pending datastore request (or None, if everything has been served from the caches).
+	"""
+	reqCache = _getRequestCache()
+	found = {}
+	missingKeys = {}
+	for key in keys:
+		strKey = str( key )
+		if reqCache is not None and strKey in reqCache:
+			found[ strKey ] = reqCache[ strKey ]
+		else:
+			missingKeys[ strKey ] = key
+	keyList = list( missingKeys.keys() )
+	while keyList: #Fetch in Batches of 30 entries, as the max size for bulk_get is limited to 32MB
+		currentBatch = keyList[:__MemCacheBatchSize__]
+		keyList = keyList[__MemCacheBatchSize__:]
+		for strKey, entity in memcache.get_multi( currentBatch, namespace=__CacheKeyPrefix__ ).items():
+			if entity == __NegativeCacheMarker__:
+				entity = None
+			found[ strKey ] = entity
+			del missingKeys[ strKey ]
+	if reqCache is not None:
+		_fillRequestCache( reqCache, { k: v for k, v in found.items() if k not in reqCache } )
+	if missingKeys:
+		rpc = ( list( missingKeys.values() ), datastore.GetAsync( list( missingKeys.values() ), **kwargs ) )
+	else:
+		rpc = None
+	return( found, rpc )
+
+def _finishCachedGet( found, rpc ):
+	"""
+		Second half of a cached Get: Waits for the datastore request started by
+		:func:`_startCachedGet` (if any) and stores its results in both cache tiers.
+		Keys the datastore didn't return an entity for are cached as missing for
+		__negativeCacheTime__ seconds.
+
+		:returns: Dictionary mapping the string representation of each key requested to its entity \
+			(or None, if it does not exist).
+		:rtype: dict
+	"""
+	if rpc is None:
+		return( found )
+	reqCache = _getRequestCache()
+	dbKeys, dbRpc = rpc
+	dbRes = { str( x ): None for x in dbKeys }
+	for entity in dbRpc.get_result():
+		if entity is None:
+			continue
+		entity = Entity.FromDatastoreEntity( entity )
+		dbRes[ str( entity.key() ) ] = entity
+	# Cache what we had fetched, including the keys we now know that they don't exist.
+	# We use add() here - it fails if that key has been locked by a recent Put()/Delete()
+	for cacheTime, cacheMap in [ ( __cacheTime__, { k: v for k, v in dbRes.items() if v is not None } ),
+				     ( __negativeCacheTime__, { k: __NegativeCacheMarker__ for k, v in dbRes.items() if v is None } ) ]:
+		cacheKeys = list( cacheMap.keys() )
+		while cacheKeys:
+			currentBatch = cacheKeys[:__MemCacheBatchSize__]
+			cacheKeys = cacheKeys[__MemCacheBatchSize__:]
+			try:
+				memcache.add_multi( { k: cacheMap[ k ] for k in currentBatch }, time=cacheTime, namespace=__CacheKeyPrefix__ )
+			except:
+				pass
+	if reqCache is not None:
+		_fillRequestCache( reqCache, dbRes )
+	if conf["viur.debug.traceQueries"]:
+		logging.debug( "Fetched a result-set from Datastore: %s total, %s from cache, %s from datastore, %s missing" % (len(found)+len(dbRes), len(found), len(dbRes), len([x for x in dbRes.values() if x is None])) )
+	found.update( dbRes )
+	return( found )
+
+def _resultFromCache( keys, found ):
+	"""
+		Builds the result for :func:`server.db.Get` from the dictionary returned by :func:`_finishCachedGet`.
+
+		As entities are shared between callers through the per-request cache, each caller receives
+		its own copy.
+	"""
+	if isinstance( keys, list ):
+		return( [ Entity.FromDatastoreEntity( found[ str(x) ] ) for x in keys if found.get( str(x) ) is not None ] )
+	if found.get( str( keys ) ) is None:
+		raise EntityNotFoundError()
+	res = Entity.FromDatastoreEntity( found[ str( keys ) ] )
+	res[ "key" ] = str( res.key() )
+	return( res )
+
+def _getKindGeneration( kind ):
+	"""
+		Returns the current generation of *kind* used to build the keys of cached query results.
+
+		The generation is bumped on each write to that kind, so all cached results for
+		this kind become unreachable at once. If the counter got evicted from memcache,
+		it's reinitialized with the current time, so that old generations aren't reused.
+
+		:returns: The generation, or None if it's currently unavailable.
+		:rtype: int | long | None
+	"""
+	gen = memcache.get( kind, namespace=__QueryGenerationKeyPrefix__ )
+	if gen is None:
+		gen = long( time()*1000 )
+		if not memcache.add( kind, gen, namespace=__QueryGenerationKeyPrefix__ ):
+			#Someone else has been faster
+			gen = memcache.get( kind, namespace=__QueryGenerationKeyPrefix__ )
+	return( gen )
+
+def _bumpKindGenerations( kinds ):
+	"""
+		Invalidates all cached query results for the given kinds.
+
+		:param kinds: List of kind names which have been written to.
+		:type kinds: list of str
+	"""
+	if not conf["viur.db.queryCacheTime"] or conf["viur.db.caching" ]<2:
+		return
+	kinds = set( kinds )
+	if not kinds:
+		return
+	pendingKinds = getattr( __transactionKinds__, "kinds", None )
+	if pendingKinds is not None and datastore.IsInTransaction():
+		# Queries still see the old data until that transaction commits, so bump them again then
+		pendingKinds.update( kinds )
+	memcache.offset_multi( { k: 1 for k in kinds }, namespace=__QueryGenerationKeyPrefix__ )
+
+class PendingWrite( object ):
+	"""
+		Wraps the RPC of an asynchronous Put or Delete.
+
+		Queries running while that write is applied might still cache the old data, so ``get_result()``
+		bumps the generations of the kinds written again once it's completed.
+	"""
+	def __init__( self, rpc, kinds ):
+		super( PendingWrite, self ).__init__()
+		self.rpc = rpc
+		self.kinds = kinds
+
+	def get_result( self ):
+		res = self.rpc.get_result()
+		_bumpKindGenerations( self.kinds )
+		return( res )
+
+	def __getattr__( self, name ):
+		return( getattr( self.rpc, name ) )
+
+class BatchedResult( object ):
+	"""
+		Result of a Get or Put queued by the :class:`AutoBatcher`.
+
+		Looks like an RPC-object; ``get_result()`` flushes the batcher if the call is still pending.
+	"""
+	def __init__( self, batcher ):
+		super( BatchedResult, self ).__init__()
+		self.batcher = batcher
+		self.done = False
+		self.result = None
+		self.exception = None
+
+	def setResult( self, result ):
+		self.result = result
+		self.done = True
+
+	def setException( self, exception ):
+		self.exception = exception
+		self.done = True
+
+	def get_result( self ):
+		if not self.done:
+			self.batcher.flush()
+		if self.exception is not None:
+			raise self.exception
+		return( self.result )
+
+class AutoBatcher( object ):
+	"""
+		Collects the Gets and Puts issued during a request (outside of transactions), so
+		independent calls share one datastore RPC.
+
+		Queued calls are sent once the result of one of them is needed, on the next blocking
+		Get or Put (which joins the batch), before any Delete, query or transaction, and at
+		the end of the request (see :func:`flushAutoBatcher`). Puts are sent before Gets, so
+		reads always see the writes queued before them.
+		Enabled by ``conf["viur.db.autoBatch"]``.
+	"""
+	def __init__( self ):
+		super( AutoBatcher, self ).__init__()
+		self.gets = [] # List of (keys, BatchedResult)
+		self.puts = [] # List of (entities, BatchedResult)
+		self.putKeys = set() # String representation of the keys of the entities in self.puts
+
+	def get( self, keys ):
+		res = BatchedResult( self )
+		self.gets.append( ( keys, res ) )
+		return( res )
+
+	def put( self, entities ):
+		entityList = entities if isinstance( entities, list ) else [ entities ]
+		strKeys = [ str( x.key() ) for x in entityList if x.is_saved() ]
+		if any( [ x in self.putKeys for x in strKeys ] ):
+			# That entity has already been queued; the older version must be written first
+			self.flush()
+		self.putKeys.update( strKeys )
+		res = BatchedResult( self )
+		self.puts.append( ( entities, res ) )
+		return( res )
+
+	def flush( self ):
+		"""
+			Sends all queued calls. Errors are passed to the results of the affected calls.
+		"""
+		if not ( self.gets or self.puts ):
+			return
+		if datastore.IsInTransaction(): #Our calls must not become part of that transaction
+			return( datastore.NonTransactional( self.flush )() )
+		puts, gets = self.puts, self.gets
+		self.puts, self.gets, self.putKeys = [], [], set()
+		if puts:
+			self._flushPuts( puts )
+		if gets:
+			self._flushGets( gets )
+
+	def _flushPuts( self, puts ):
+		entities = []
+		for entityList, res in puts:
+			entities.extend( entityList if isinstance( entityList, list ) else [ entityList ] )
+		try:
+			rpcs = [ datastore.PutAsync( entities[ x: x+__MaxPutBatchSize__ ] ) for x in range( 0, len( entities ), __MaxPutBatchSize__ ) ]
+			keys = []
+			for rpc in rpcs:
+				keys.extend( rpc.get_result() )
+		except Exception as e:
+			logging.exception( e )
+			for entityList, res in puts:
+				res.setException( e )
+			return
+		finally: # Whatever has been cached meanwhile (the write might have been queued for minutes) is outdated now
+			_invalidateWrite( entities )
+		idx = 0
+		for entityList, res in puts:
+			if isinstance( entityList, list ):
+				res.setResult( keys[ idx: idx+len( entityList ) ] )
+				idx += len( entityList )
+			else:
+				res.setResult( keys[ idx ] )
+				idx += 1
+
+	def _flushGets( self, gets ):
+		keys = []
+		for keyList, res in gets:
+			keys.extend( keyList if isinstance( keyList, list ) else [ keyList ] )
+		try:
+			found = _finishCachedGet( *_startCachedGet( keys ) )
+		except Exception as e:
+			logging.exception( e )
+			for keyList, res in gets:
+				res.setException( e )
+			return
+		for keyList, res in gets:
+			try:
+				res.setResult( _resultFromCache( keyList, found ) )
+			except Exception as e: #EntityNotFoundError
+				res.setException( e )
+
+def _getAutoBatcher():
+	"""
+		Returns the :class:`AutoBatcher` of the current request.
+
+		:returns: The batcher, or None if batching is disabled, we're inside a transaction \
+			or no request is bound to this thread.
+		:rtype: AutoBatcher | None
+	"""
+	if not conf["viur.db.autoBatch"] or datastore.IsInTransaction():
+		return( None )
+	try:
+		reqData = request.current.requestData()
+	except AttributeError: # There's no request (yet)
+		return( None )
+	if not __AutoBatcherKey__ in reqData:
+		reqData[ __AutoBatcherKey__ ] = AutoBatcher()
+	return( reqData[ __AutoBatcherKey__ ] )
+
+def flushAutoBatcher():
+	"""
+		Sends all Gets and Puts queued by the :class:`AutoBatcher` of the current request.
+
+		Called before deletes, queries and transactions, and at the end of each request.
+	"""
+	try:
+		batcher = request.current.requestData().get( __AutoBatcherKey__ )
+	except AttributeError: # There's no request (yet)
+		return
+	if batcher is not None:
+		batcher.flush()
+
+def _kindFromKey( key ):
+	"""
+		Returns the kind of *key*, which might be given in its string representation.
+	"""
+	if not isinstance( key, datastore_types.Key ):
+		key = datastore_types.Key( encoded=key )
+	return( key.kind() )
+
+def _keyKinds( keys ):
+	"""
+		Returns the kinds of one or more *keys*, which might be given in their string representation.
+	"""
+	return( [ _kindFromKey( x ) for x in keys ] if isinstance( keys, ( list, tuple ) ) else [ _kindFromKey( keys ) ] )
+
+def _isCacheableGet( keys ):
+	"""
+		Returns True if a Get of *keys* can be served using our caches.
+	"""
+	return( conf["viur.db.caching" ]>0 and not datastore.IsInTransaction() and
+		( isinstance( keys, datastore_types.Key ) or isinstance( keys, basestring ) or isinstance( keys, list ) ) )
+
+def _kindsOf( entities ):
+	"""
+		Returns the kinds of one or more *entities*.
+	"""
+	return( [ x.kind() for x in entities ] if isinstance( entities, list ) else [ entities.kind() ] )
+
+def _invalidateWrite( entities ):
+	"""
+		Removes one or more *entities* which are about to be (or have just been) written from our
+		caches, and invalidates the cached query results for their kinds.
+	"""
+	if conf["viur.db.caching" ]<1:
+		return
+	entityList = entities if isinstance( entities, list ) else [ entities ]
+	_invalidateCache( [ x.key() for x in entityList if x.is_saved() ] )
+	_bumpKindGenerations( _kindsOf( entities ) )
+
 def PutAsync( entities, **kwargs ):
 	"""
 		Asynchronously store one or more entities in the data store.
@@ -33,20 +438,18 @@ def PutAsync( entities, **kwargs ):
 	"""
 	if isinstance( entities, Entity ):
 		entities._fixUnindexedProperties()
-	elif isinstance( entities, List ):
+	elif isinstance( entities, list ):
 		for entity in entities:
 			assert isinstance( entity, Entity )
 			entity._fixUnindexedProperties()
+	batcher = None if kwargs else _getAutoBatcher()
+	if batcher is not None: # Invalidates our caches once it has actually been written
+		return( batcher.put( entities ) )
+	_invalidateWrite( entities )
+	rpc = datastore.PutAsync( entities, **kwargs )
 	if conf["viur.db.caching" ]>0:
-		if isinstance( entities, Entity ): #Just one:
-			if entities.is_saved(): #Its an update
-				memcache.delete( str( entities.key() ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
-		elif isinstance( entities, list ):
-			for entity in entities:
-				assert isinstance( entity, Entity )
-				if entity.is_saved(): #Its an update
-					memcache.delete( str( entity.key() ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
-	return( datastore.PutAsync( entities, **kwargs ) )
+		rpc = PendingWrite( rpc, _kindsOf( entities ) )
+	return( rpc )
 
 def Put( entities, **kwargs ):
 	"""
@@ -75,16 +478,14 @@ def Put( entities, **kwargs ):
 		for entity in entities:
 			assert isinstance( entity, Entity )
 			entity._fixUnindexedProperties()
-	if conf["viur.db.caching" ]>0:
-		if isinstance( entities, Entity ): #Just one:
-			if entities.is_saved(): #Its an update
-				memcache.delete( str( entities.key() ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
-		elif isinstance( entities, list ):
-			for entity in entities:
-				assert isinstance( entity, Entity )
-				if entity.is_saved(): #Its an update
-					memcache.delete( str( entity.key() ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
-	return( datastore.Put( entities, **kwargs ) )
+	batcher = None if kwargs else _getAutoBatcher()
+	if batcher is not None: # Send it together with everything queued so far
+		return( batcher.put( entities ).get_result() )
+	_invalidateWrite( entities )
+	res = datastore.Put( entities, **kwargs )
+	if conf["viur.db.caching" ]>0: # Queries running meanwhile might have cached the old data
+		_bumpKindGenerations( _kindsOf( entities ) )
+	return( res )
 
 def GetAsync( keys, **kwargs ):
 	"""
@@ -96,21 +497,24 @@ def GetAsync( keys, **kwargs ):
 	"""
 	class AsyncResultWrapper:
 		"""
-			Wraps an result thats allready there into something looking
+			Wraps the pending part of a cached Get into something looking
 			like an RPC-Object.
 		"""
-		def __init__( self, res ):
-			self.res = res
+		def __init__( self, keys, found, rpc ):
+			self.keys = keys
+			self.found = found
+			self.rpc = rpc
 
 		def get_result( self ):
-			return( self.res )
-	if conf["viur.db.caching" ]>0 and not datastore.IsInTransaction():
-		if isinstance( keys, datastore_types.Key ) or isinstance( keys, basestring ): #Just one:
-			res = memcache.get( str(keys), namespace=__CacheKeyPrefix__ )
-			if res:
-				return( AsyncResultWrapper( res ) )
-	#Either the result wasnt found, or we got a list of keys to fetch;
-	# --> no caching possible
+			return( _resultFromCache( self.keys, _finishCachedGet( self.found, self.rpc ) ) )
+
+	if _isCacheableGet( keys ):
+		batcher = None if kwargs else _getAutoBatcher()
+		if batcher is not None:
+			return( batcher.get( keys ) )
+		found, rpc = _startCachedGet( keys if isinstance( keys, list ) else [ keys ], **kwargs )
+		return( AsyncResultWrapper( keys, found, rpc ) )
+	#Caching is disabled or we're inside a transaction
 	return( datastore.GetAsync( keys, **kwargs ) )
 
 def Get( keys, **kwargs ):
@@ -129,6 +533,10 @@ def Get( keys, **kwargs ):
 		that corresponds to the sequence of keys. It will include entities for keys
 		that were found and None placeholders for keys that were not found.
 
+		Unless called inside a transaction, entities are served from a two-tiered cache:
+		A per-request dictionary deduplicating Gets of the same key within one request,
+		and memcache shared between all instances.
+
 		:param keys: Key, str or list of keys or strings to be retrieved.
 		:type keys: Key | str | list of Key | list of str
 
@@ -139,49 +547,14 @@ def Get( keys, **kwargs ):
 		:returns: Entity or list of Entity objects corresponding to the specified key(s).
 		:rtype: :class:`server.db.Entity` | list of :class:`server.db.Entity`
 	"""
-	if conf["viur.db.caching" ]>0  and not datastore.IsInTransaction():
-		if isinstance( keys, datastore_types.Key ) or isinstance( keys, basestring ): #Just one:
-			res = memcache.get( str(keys), namespace=__CacheKeyPrefix__ )
-			if not res: #Not cached - fetch and cache it :)
-				res = Entity.FromDatastoreEntity( datastore.Get( keys, **kwargs ) )
-				res[ "key" ] = str( res.key() )
-				memcache.set( str(res.key() ), res, time=__cacheTime__, namespace=__CacheKeyPrefix__ )
-			return( res )
-		#Either the result wasnt found, or we got a list of keys to fetch;
-		elif isinstance( keys,list ):
-			#Check Memcache first
-			cacheRes = {}
-			tmpRes = []
-			keyList = [ str(x) for x in keys ]
-			while keyList: #Fetch in Batches of 30 entries, as the max size for bulk_get is limited to 32MB
-				currentBatch = keyList[:__MemCacheBatchSize__]
-				keyList = keyList[__MemCacheBatchSize__:]
-				cacheRes.update( memcache.get_multi( currentBatch, namespace=__CacheKeyPrefix__) )
-			#Fetch the rest from DB
-			missigKeys = [ x for x in keys if not str(x) in cacheRes ]
-			dbRes = [ Entity.FromDatastoreEntity(x) for x in datastore.Get( missigKeys ) if x is not None ]
-			# Cache what we had fetched
-			saveIdx = 0
-			while len(dbRes)>saveIdx*__MemCacheBatchSize__:
-				cacheMap = {str(obj.key()): obj for obj in dbRes[saveIdx*__MemCacheBatchSize__:(saveIdx+1)*__MemCacheBatchSize__]}
-				try:
-					memcache.set_multi( cacheMap, time=__cacheTime__ , namespace=__CacheKeyPrefix__ )
-				except:
-					pass
-				saveIdx += 1
-			for key in [ str(x) for x in keys ]:
-				if key in cacheRes:
-					tmpRes.append( cacheRes[ key ] )
-				else:
-					for e in dbRes:
-						if str( e.key() ) == key:
-							tmpRes.append ( e )
-							break
-			if conf["viur.debug.traceQueries"]:
-				logging.debug( "Fetched a result-set from Datastore: %s total, %s from cache, %s from datastore" % (len(tmpRes),len( cacheRes.keys()), len( dbRes ) ) )
-			return( tmpRes )
+	if _isCacheableGet( keys ):
+		batcher = None if kwargs else _getAutoBatcher()
+		if batcher is not None: # Send it together with everything queued so far
+			return( batcher.get( keys ).get_result() )
+		found, rpc = _startCachedGet( keys if isinstance( keys, list ) else [ keys ], **kwargs )
+		return( _resultFromCache( keys, _finishCachedGet( found, rpc ) ) )
 	if isinstance( keys, list ):
-		return( [ Entity.FromDatastoreEntity(x) for x in datastore.Get( keys, **kwargs ) ] )
+		return( [ Entity.FromDatastoreEntity(x) if x is not None else None for x in datastore.Get( keys, **kwargs ) ] )
 	else:
 		return( Entity.FromDatastoreEntity( datastore.Get( keys, **kwargs ) ) )
 
@@ -226,7 +599,7 @@ def GetOrInsert( key, kindName=None, parent=None, **kwargs ):
 	if datastore.IsInTransaction():
 		return txn(key, kwargs)
 
-	return datastore.RunInTransaction( txn, key, kwargs )
+	return RunInTransaction( txn, key, kwargs )
 
 def DeleteAsync(keys, **kwargs):
 	"""
@@ -236,13 +609,17 @@ def DeleteAsync(keys, **kwargs):
 		returns an asynchronous object. Call ``get_result()`` on the return value to
 		block on the call and get the results.
 	"""
+	flushAutoBatcher()
 	if conf["viur.db.caching" ]>0:
-		if isinstance( keys, datastore_types.Key ): #Just one:
-			memcache.delete( str( keys ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
+		if isinstance( keys, datastore_types.Key ) or isinstance( keys, basestring ): #Just one:
+			_invalidateCache( [ keys ] )
+			_bumpKindGenerations( [ _kindFromKey( keys ) ] )
 		elif isinstance( keys, list ):
 			for key in keys:
 				assert isinstance( key, datastore_types.Key ) or isinstance( key, basestring )
-				memcache.delete( str( key ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
+			_invalidateCache( keys )
+			_bumpKindGenerations( [ _kindFromKey( x ) for x in keys ] )
+		return( PendingWrite( datastore.DeleteAsync( keys, **kwargs ), _keyKinds( keys ) ) )
 	return( datastore.DeleteAsync( keys, **kwargs ) )
 
 def Delete(keys, **kwargs):
@@ -264,16 +641,88 @@ def Delete(keys, **kwargs):
 
 		:raises: :exc:`TransactionFailedError`, if the deletion could not be committed.
 	"""
+	flushAutoBatcher()
 	if conf["viur.db.caching" ]>0:
 		if isinstance( keys, datastore_types.Key ) or isinstance( keys, basestring ): #Just one:
-			memcache.delete( str( keys ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
+			_invalidateCache( [ keys ] )
+			_bumpKindGenerations( [ _kindFromKey( keys ) ] )
 		elif isinstance( keys, list ):
 			for key in keys:
 				assert isinstance( key, datastore_types.Key ) or isinstance( key, basestring )
-				memcache.delete( str( key ), namespace=__CacheKeyPrefix__, seconds=__cacheLockTime__  )
+			_invalidateCache( keys )
+			_bumpKindGenerations( [ _kindFromKey( x ) for x in keys ] )
+		res = datastore.Delete( keys, **kwargs )
+		_bumpKindGenerations( _keyKinds( keys ) ) # Queries running meanwhile might have cached the old data
+		return( res )
 	return( datastore.Delete( keys, **kwargs ) )
 
 
+class MultiQueryCursor( object ):
+	"""
+		Cursor of a query merging the results of several sub-queries (ie. IN, != or viur_tags
+		filters and spatial queries).
+
+		It holds the position reached in each sub-query and the state of the merge (if the merge
+		needs any), so the next page continues each sub-query where it stopped instead of
+		fetching all previous pages again.
+	"""
+	prefix = "mq." # Not part of the alphabet of datastore cursors
+
+	def __init__( self, cursors, state=None ):
+		"""
+			:param cursors: For each sub-query the cursor to continue at, None to start at\
+			its beginning or False if it has no more results.
+			:type cursors: list of datastore_query.Cursor | None | bool
+			:param state: The position a custom merge (see :func:`server.db.Query.run`) has reached,\
+			as list of the value it sorts by and the key of the last entity returned (or None).
+			:type state: [int | long | float, str] | None
+		"""
+		super( MultiQueryCursor, self ).__init__()
+		self.cursors = cursors
+		self.state = state
+
+	def urlsafe( self ):
+		"""
+			Encodes this cursor, so it can be passed to :func:`server.db.Query.cursor`.
+
+			:rtype: str
+		"""
+		data = { "c": [ x.urlsafe() if isinstance( x, datastore_query.Cursor ) else x for x in self.cursors ] }
+		if self.state is not None:
+			data["s"] = self.state
+		return( self.prefix + base64.urlsafe_b64encode( json.dumps( data, separators=(",", ":") ) ) )
+
+	def __str__( self ):
+		return( self.urlsafe() )
+
+	@classmethod
+	def fromUrlsafe( cls, cursor ):
+		"""
+			Decodes a cursor returned by :func:`urlsafe`.
+
+			:raises: :exc:`BadValueError` if *cursor* isn't a valid cursor of a MultiQuery.
+		"""
+		if not cursor.startswith( cls.prefix ):
+			raise BadValueError("Not a cursor of a MultiQuery")
+		try:
+			data = json.loads( base64.urlsafe_b64decode( str( cursor[ len( cls.prefix ): ] ) ) )
+			cursors = []
+			for c in data["c"]:
+				if isinstance( c, basestring ):
+					c = datastore_query.Cursor( urlsafe=c )
+				elif not ( c is None or c is False ):
+					raise ValueError()
+				cursors.append( c )
+			state = data.get( "s" )
+			if state is not None and not ( isinstance( state, list ) and len( state ) == 2
+				and isinstance( state[0], ( int, long, float ) ) and not isinstance( state[0], bool )
+				and isinstance( state[1], basestring ) ):
+					raise ValueError()
+		except ( ValueError, TypeError, KeyError, AttributeError ):
+			raise BadValueError("Invalid cursor")
+		return( cls( cursors, state ) )
+
+
 class Query( object ):
 	"""
 		Thin wrapper around datastore.Query to provide a consistent
@@ -291,7 +740,10 @@ class Query( object ):
 		self._customMultiQueryMerge = None # Sometimes, the default merge functionality from MultiQuery is not sufficient
 		self._calculateInternalMultiQueryAmount = None # Some (Multi-)Queries need a different amount of results per subQuery than actually returned
 		self.customQueryInfo = {} # Allow carrying custom data along with the query. Currently only used by spartialBone to record the guranteed correctnes
+		self._customMultiQueryCursors = False # If the custom merge supports cursors (see MultiQueryCursor)
+		self._multiQueryMergeState = None # State of a custom merge supporting cursors, passed along with its cursors
 		self.origKind = kind
+		self._cachedCursor = __undefinedC__ # The end-cursor of the last run, if it hasn't been provided by the datastore
 
 	def setFilterHook(self, hook):
 		"""
@@ -407,6 +859,7 @@ class Query( object ):
 			for tag in taglist[:30]: #Limit to max 30 keywords
 				q = datastore.Query( kind=origFilter.__kind )
 				q[ "viur_tags" ] = tag
+				q.Order( *origFilter.__orderings )
 				queries.append( q )
 			self.datastoreQuery = datastore.MultiQuery( queries, origFilter.__orderings )
 			for k, v in origFilter.items():
@@ -465,12 +918,18 @@ class Query( object ):
 				raise NotImplementedError("You cannot use multiple IN or != filter")
 			origQuery = self.datastoreQuery
 			queries = []
+			orderings = origQuery.__orderings
 			if filter.endswith("!="):
+				# Both sub-queries are sorted by that property first (as required for inequality
+				# filters), so merge them that way, too
+				orderings = orderings or [ ( filter.split(" ")[0], ASCENDING ) ]
 				q = datastore.Query( kind=self.getKind() )
 				q[ "%s <" % filter.split(" ")[0] ] = value
+				q.Order( *orderings )
 				queries.append( q )
 				q = datastore.Query( kind=self.getKind() )
 				q[ "%s >" % filter.split(" ")[0] ] = value
+				q.Order( *orderings )
 				queries.append( q )
 			else: #IN filter
 				if not (isinstance( value, list ) or isinstance( value, tuple ) ):
@@ -478,9 +937,9 @@ class Query( object ):
 				for val in value:
 					q = datastore.Query( kind=self.getKind() )
 					q[ "%s =" % filter.split(" ")[0] ] = val
-					q.Order( *origQuery.__orderings )
+					q.Order( *orderings )
 					queries.append( q )
-			self.datastoreQuery = MultiQuery( queries, origQuery.__orderings )
+			self.datastoreQuery = MultiQuery( queries, orderings )
 			for k,v in origQuery.items():
 				self.datastoreQuery[ k ] = v
 		elif filter and value is not __undefinedC__:
@@ -555,6 +1014,17 @@ class Query( object ):
 				return( self )
 		if self.datastoreQuery is None:
 			return
+		if isinstance( self.datastoreQuery, datastore.MultiQuery ):
+			# A MultiQuery has no kind of its own (so it refuses most orderings) and merges
+			# its results by the orderings passed to its constructor, so order each sub-query
+			# and update the orderings used for merging instead
+			boundQueries = getattr( self.datastoreQuery, "_MultiQuery__bound_queries" )
+			for qry in boundQueries:
+				qry.Order( *orderings )
+			if boundQueries:
+				orderings = getattr( boundQueries[0], "_Query__orderings" )
+			setattr( self.datastoreQuery, "_MultiQuery__orderings", list( orderings ) )
+			return( self )
 		self.datastoreQuery.Order( *orderings )
 		return( self )
 
@@ -588,12 +1058,27 @@ class Query( object ):
 			Its safe to use client-supplied cursors, a cursor can't be abused to access entities
 			which don't match the current filters.
 
+			Queries merging several sub-queries (IN, != filters etc.) use a
+			:class:`server.db.MultiQueryCursor` instead, which doesn't support end-cursors.
+
 			:param cursor: The cursor key to set to the Query.
-			:type cursor: str | datastore_query.Cursor
+			:type cursor: str | datastore_query.Cursor | server.db.MultiQueryCursor
 
 			:returns: Returns the query itself for chaining.
 			:rtype: server.db.Query
 		"""
+		if isinstance( self.datastoreQuery, datastore.MultiQuery ):
+			if isinstance( cursor, basestring ):
+				cursor = MultiQueryCursor.fromUrlsafe( cursor )
+			elif not ( isinstance( cursor, MultiQueryCursor ) or cursor is None ):
+				raise ValueError("Cursor must be String, MultiQueryCursor or None")
+			if endCursor is not None:
+				raise NotImplementedError("End-cursors are not supported on MultiQueries")
+			if cursor and len( cursor.cursors ) != len( getattr( self.datastoreQuery, "_MultiQuery__bound_queries" ) ):
+				raise BadValueError("This cursor belongs to a different query")
+			self._multiQueryMergeState = cursor.state if cursor else None
+			self._origCursor = cursor
+			return( self )
 		if isinstance( cursor, basestring ):
 			cursor = datastore_query.Cursor( urlsafe=cursor )
 		elif isinstance( cursor, datastore_query.Cursor ) or cursor==None:
@@ -697,7 +1182,10 @@ class Query( object ):
 			:rtype: list
 		"""
 		try:
-			order = self.datastoreQuery.__orderings
+			if isinstance( self.datastoreQuery, datastore.MultiQuery ):
+				order = getattr( self.datastoreQuery, "_MultiQuery__orderings" )
+			else:
+				order = self.datastoreQuery.__orderings
 			return( [ (prop, dir) for (prop, dir) in order ] )
 		except:
 			return( [] )
@@ -721,7 +1209,8 @@ class Query( object ):
 		"""
 		if self.datastoreQuery is None:
 			return( None )
-
+		if self._cachedCursor is not __undefinedC__: # From the query cache or one of our MultiQuery merges
+			return( self._cachedCursor )
 		return( self.datastoreQuery.GetCursor() )
 
 	def getKind(self):
@@ -749,9 +1238,12 @@ class Query( object ):
 		"""
 			Returns the ancestor of this query (if any).
 
-			:rtype: str | None
+			:rtype: Key | None
 		"""
-		return( self.datastoreQuery.ancestor )
+		if self.datastoreQuery is None or isinstance( self.datastoreQuery, datastore.MultiQuery ):
+			return( None )
+		ancestorPb = self.datastoreQuery.__ancestor_pb
+		return( datastore_types.Key._FromPb( ancestorPb ) if ancestorPb is not None else None )
 
 	def run(self, limit=-1, keysOnly=False, **kwargs):
 		"""
@@ -778,6 +1270,7 @@ class Query( object ):
 			:raises: :exc:`BadQueryError` if an IN filter in combination with a sort order on\
 			another property is provided
 		"""
+		flushAutoBatcher()
 		if self.datastoreQuery is None:
 			return( None )
 		origLimit = limit if limit!=-1 else self.amount
@@ -788,20 +1281,69 @@ class Query( object ):
 			internalKeysOnly = False
 		if conf["viur.db.caching" ]<2:
 			# Query-Caching is disabled, make this query keys-only if (and only if) explicitly requested for this query
-			internalKeysOnly = keysOnly
-		if self._customMultiQueryMerge:
+			# (MultiQueries need the entities to merge the results of their sub-queries)
+			internalKeysOnly = keysOnly and not isinstance( self.datastoreQuery, datastore.MultiQuery )
+		self._cachedCursor = __undefinedC__
+		queryCacheKey = None
+		cachedRes = None
+		if conf["viur.db.queryCacheTime"] and conf["viur.db.caching" ]>1 and internalKeysOnly \
+			and not self._customMultiQueryMerge and not datastore.IsInTransaction():
+				queryCacheKey = self._queryCacheKey( kwargs )
+				if queryCacheKey:
+					cachedRes = memcache.get( queryCacheKey, namespace=__QueryCacheKeyPrefix__ )
+		lookupKeys = self._getLookupKeys() if cachedRes is None else None
+		if cachedRes is not None:
+			res = [ datastore_types.Key( encoded=x ) for x in cachedRes["keys"] ]
+			self._cachedCursor = datastore_query.Cursor( urlsafe=cachedRes["cursor"] ) if cachedRes["cursor"] else None
+		elif lookupKeys is not None:
+			# Nothing but a list of keys, so there's no need to run a query for each of them
+			res = self._runKeyLookup( lookupKeys, origLimit )
+			internalKeysOnly = False
+			self._cachedCursor = None
+		elif isinstance( self.datastoreQuery, datastore.MultiQuery ) and \
+			( self._customMultiQueryCursors or ( not self._customMultiQueryMerge and self._subQueriesSortedAlike() ) ):
+			# Run the sub-queries and merge their results ourselves, so we know where each of them
+			# has to continue on the next page
+			if self._customMultiQueryMerge and self._calculateInternalMultiQueryAmount:
+				kwargs["limit"] = self._calculateInternalMultiQueryAmount( kwargs["limit"] )
+			if kwargs["limit"]:
+				kwargs.setdefault( "batch_size", kwargs["limit"] )
+				kwargs.setdefault( "prefetch_size", kwargs["limit"] )
+			if isinstance( self._origCursor, MultiQueryCursor ):
+				startCursors = self._origCursor.cursors
+			else:
+				startCursors = [ None ] * len( getattr( self.datastoreQuery, "_MultiQuery__bound_queries" ) )
+			results = self._runSubQueries( startCursors, internalKeysOnly, kwargs )
+			if self._customMultiQueryMerge:
+				res = self._customMultiQueryMerge( self, [ [ x[0] for x in r ] for r in results ], origLimit )
+			else:
+				res = self._mergeSubQueryResults( results, origLimit )
+			self._cachedCursor = self._buildMultiQueryCursor( results, startCursors, res, kwargs["limit"] )
+		elif self._customMultiQueryMerge:
 			# We do a really dirty trick here: Running the queries in our MultiQuery by hand, as
 			# we don't want the default sort&merge functionality from :class:`google.appengine.api.datastore.MultiQuery`
 			assert isinstance( self.datastoreQuery, MultiQuery), "Got a customMultiQueryMerge - but no multiQuery"
 			res = []
 			if self._calculateInternalMultiQueryAmount:
 				kwargs["limit"] = self._calculateInternalMultiQueryAmount(kwargs["limit"])
+			# Run() just starts the RPC fetching the first batch of a query, so all sub-queries
+			# run concurrently. Make that batch large enough for the whole result, so reading the
+			# results doesn't issue further RPCs one sub-query after another.
+			kwargs.setdefault( "batch_size", kwargs["limit"] )
+			kwargs.setdefault( "prefetch_size", kwargs["limit"] )
 			for qry in getattr(self.datastoreQuery,"_MultiQuery__bound_queries"):
 				res.append( qry.Run( keys_only=internalKeysOnly, **kwargs ) )
 			# As the results are now available, perform the actual merge
 			res = self._customMultiQueryMerge(self, res, origLimit)
 		else:
 			res = list( self.datastoreQuery.Run( keys_only=internalKeysOnly, **kwargs ) )
+			if queryCacheKey:
+				try:
+					cursor = self.datastoreQuery.GetCursor()
+				except AssertionError:
+					cursor = None
+				memcache.set( queryCacheKey, {"keys": [ str( x ) for x in res ], "cursor": cursor.urlsafe() if cursor else None},
+					      time=conf["viur.db.queryCacheTime"], namespace=__QueryCacheKeyPrefix__ )
 		if conf["viur.debug.traceQueries"]:
 			kindName = self.getKind()
 			orders = self.getOrders()
@@ -831,6 +1373,181 @@ class Query( object ):
 				res = [ x.parent() for x in res ]
 			return( Get( res ) )
 
+	def _getLookupKeys( self ):
+		"""
+			Tests if this query is nothing but a lookup of a list of keys, like the MultiQuery built
+			for an IN-filter on the key (ie. by :func:`server.bones.baseBone.buildDBFilter`).
+
+			:returns: The keys to look up, or None if this query has to be run as usual.
+			:rtype: list of Key | None
+		"""
+		if not isinstance( self.datastoreQuery, datastore.MultiQuery ) or self._customMultiQueryMerge or self._origCursor:
+			return( None )
+		keys = []
+		for qry in getattr( self.datastoreQuery, "_MultiQuery__bound_queries" ):
+			if len( qry ) != 1 or getattr( qry, "_Query__ancestor_pb", None ) is not None:
+				return( None )
+			prop, value = qry.items()[0]
+			if prop.strip() not in [ KEY_SPECIAL_PROPERTY, "%s =" % KEY_SPECIAL_PROPERTY ] or not isinstance( value, datastore_types.Key ):
+				return( None )
+			keys.append( value )
+		return( keys )
+
+	def _runKeyLookup( self, keys, limit ):
+		"""
+			Fetches the entities for a query which consists only of *keys* using one batched Get.
+
+			Just like the MultiQuery replaced, only entities of this kind are returned, ordered by
+			the orderings of this query (or by key, if there are none); entities missing a property
+			sorted by are skipped. As all results are returned at once (up to *limit*), there
+			is no cursor for such queries.
+
+			:returns: The entities found.
+			:rtype: list of server.db.Entity
+		"""
+		boundQueries = getattr( self.datastoreQuery, "_MultiQuery__bound_queries" )
+		# The MultiQuery itself has no kind unless setKind() has been called on it, but each sub-query has
+		kind = getattr( boundQueries[0], "_Query__kind" ) if boundQueries else self.getKind()
+		uniqueKeys = {}
+		for key in keys:
+			if key.kind() == kind:
+				uniqueKeys[ str( key ) ] = key
+		res = self._sortByOrders( [ x for x in Get( list( uniqueKeys.values() ) ) if x is not None ] )
+		if limit: # A limit of 0 means no limit
+			res = res[ :limit ]
+		return( res )
+
+	def _sortByOrders( self, entities ):
+		"""
+			Sorts *entities* like the datastore sorts the results of the sub-queries of our MultiQuery:
+			By their orderings, then by key. Entities lacking a property sorted by are skipped.
+
+			:rtype: list of server.db.Entity
+		"""
+		res = sorted( entities, key=lambda x: x.key() )
+		for prop, direction in reversed( self.getOrders() ): # Sort by the least significant order first
+			descending = direction == DESCENDING
+			if prop == KEY_SPECIAL_PROPERTY:
+				res.sort( key=lambda x: x.key(), reverse=descending )
+				continue
+			res = [ x for x in res if prop in x ]
+			# Multiple values are sorted by their smallest (or largest, if descending) one
+			pick = max if descending else min
+			res.sort( key=lambda x: pick( x[ prop ] ) if isinstance( x[ prop ], list ) and x[ prop ] else x[ prop ], reverse=descending )
+		return( res )
+
+	def _subQueriesSortedAlike( self ):
+		"""
+			Tests if each sub-query of our MultiQuery returns its results in the order we merge them
+			by (see :func:`_sortByOrders`). Only then the entities returned from a sub-query are
+			the first ones it found, which is what :func:`_buildMultiQueryCursor` relies on.
+
+			:rtype: bool
+		"""
+		orders = self.getOrders()
+		for qry in getattr( self.datastoreQuery, "_MultiQuery__bound_queries" ):
+			if [ (prop, dir) for (prop, dir) in getattr( qry, "_Query__orderings" ) ] != orders:
+				return( False )
+		return( True )
+
+	def _runSubQueries( self, startCursors, keysOnly, kwargs ):
+		"""
+			Runs the sub-queries of our MultiQuery concurrently, each continuing at its cursor
+			in *startCursors* (see :class:`server.db.MultiQueryCursor`).
+
+			:returns: For each sub-query, a list of tuples (entity, cursor behind that entity).
+			:rtype: list of list of tuple
+		"""
+		boundQueries = getattr( self.datastoreQuery, "_MultiQuery__bound_queries" )
+		iterators = []
+		for qry, cursor in zip( boundQueries, startCursors ):
+			if cursor is False: # Has no more results
+				iterators.append( None )
+			else: # Run() just starts fetching the first batch
+				iterators.append( qry.Run( keys_only=keysOnly, start_cursor=cursor, produce_cursors=True, **kwargs ) )
+		res = []
+		for qry, itr in zip( boundQueries, iterators ):
+			res.append( [ ( x, qry.GetCursor() ) for x in itr ] if itr is not None else [] )
+		return( res )
+
+	def _mergeSubQueryResults( self, results, limit ):
+		"""
+			Merges the *results* of our sub-queries (as returned by :func:`_runSubQueries`) like
+			datastore.MultiQuery does: Sorted and without duplicates.
+
+			:rtype: list of server.db.Entity
+		"""
+		seen = set()
+		res = []
+		for entity in self._sortByOrders( [ x[0] for r in results for x in r ] ):
+			key = str( entity.key() )
+			if key in seen: # Matched by more than one sub-query
+				continue
+			seen.add( key )
+			res.append( entity )
+			if limit and len( res ) >= limit:
+				break
+		return( res )
+
+	def _buildMultiQueryCursor( self, results, startCursors, res, limit ):
+		"""
+			Builds the cursor to continue behind the entities *res*, which have been merged from
+			the *results* of our sub-queries (as returned by :func:`_runSubQueries`).
+
+			Each sub-query continues behind the longest run of returned entities from its start.
+			A sub-query is exhausted if it found less than *limit* entities (or *limit* is 0) and all
+			of them have been returned.
+
+			:returns: The cursor, or None if there are no more results.
+			:rtype: server.db.MultiQueryCursor | None
+		"""
+		returned = set( str( x.key() ) for x in res )
+		cursors = []
+		for entries, cursor in zip( results, startCursors ):
+			consumed = 0
+			for entity, entityCursor in entries:
+				if not str( entity.key() ) in returned:
+					break
+				cursor = entityCursor
+				consumed += 1
+			if consumed == len( entries ) and ( not limit or len( entries ) < limit ):
+				cursor = False
+			cursors.append( cursor )
+		if all( x is False for x in cursors ):
+			return( None )
+		return( MultiQueryCursor( cursors, self._multiQueryMergeState ) )
+
+	def _queryCacheKey( self, kwargs ):
+		"""
+			Derives the memcache key used to cache the result of running this query with *kwargs*.
+
+			Like :func:`server.indexes.IndexMannager.keyFromQuery`, this key is stable regardless
+			in which order the filters have been applied. It includes the current generation of
+			the queried kind, so any write to that kind invalidates it.
+
+			:param kwargs: The keyword arguments passed to datastore.Query.Run()
+			:type kwargs: dict
+
+			:returns: The key or None, if this query result cannot be cached right now.
+			:rtype: str | None
+		"""
+		kind = self.getKind()
+		generation = _getKindGeneration( kind )
+		if generation is None:
+			return( None )
+		qo = self.datastoreQuery.__query_options
+		origFilter = [ (x, repr( y )) for x, y in self.getFilter().items() ]
+		origFilter.sort( key=lambda x: x[0] )
+		for k, v in self.getOrders(): # The order of orderings matters, so these are not sorted
+			origFilter.append( ("__%s =" % k, repr( v )) )
+		origFilter.append( ("__ancestor =", repr( getattr( self.datastoreQuery, "_Query__ancestor_pb", None ) ) ) )
+		origFilter.append( ("__cursor =", qo.start_cursor.urlsafe() if qo.start_cursor else None) )
+		origFilter.append( ("__endCursor =", qo.end_cursor.urlsafe() if qo.end_cursor else None) )
+		for k, v in sorted( kwargs.items() ):
+			origFilter.append( ("__%s =" % k, repr( v )) )
+		filterKey = "".join( ["%s%s" % (x, y) for x, y in origFilter ] )
+		return( "%s:%s:%s" % ( kind, generation, sha256( filterKey ).hexdigest() ) )
+
 	def fetch(self, limit=-1, **kwargs ):
 		"""
 			Run this query and fetch results as :class:`server.skeleton.SkelList`.
@@ -870,12 +1587,12 @@ class Query( object ):
 			self.srcSkel.setValues(e)
 			res.append( self.srcSkel.getValuesCache() )
 		try:
-			c = self.datastoreQuery.GetCursor()
+			c = self.getCursor()
 			if c:
 				res.cursor = c.urlsafe()
 			else:
 				res.cursor = None
-		except AssertionError: #No Cursors avaiable on MultiQueries ( in or != )
+		except AssertionError: #No Cursors avaiable on MultiQueries with a custom merge not supporting them
 			res.cursor = None
 		return( res )
 
@@ -898,6 +1615,7 @@ class Query( object ):
 			:param keysOnly: If the query should be used to retrieve entity keys only.
 			:type keysOnly: bool
 		"""
+		flushAutoBatcher()
 		if self.datastoreQuery is None: #Noting to pull here
 			raise StopIteration()
 		if isinstance( self.datastoreQuery, datastore.MultiQuery ) and keysOnly:
@@ -979,6 +1697,7 @@ class Query( object ):
 			:returns: The number of results.
 			:rtype: int
 			"""
+		flushAutoBatcher()
 		return( self.datastoreQuery.Count( limit, **kwargs ) )
 
 	def clone(self, keysOnly=None):
@@ -1003,6 +1722,9 @@ class Query( object ):
 			res.order( orders[0] )
 		elif len( orders ) > 1:
 			res.order( tuple( orders ) )
+		ancestor = self.getAncestor()
+		if ancestor is not None:
+			res.ancestor( ancestor )
 		return( res )
 
 
@@ -1124,9 +1846,46 @@ class Entity( datastore.Entity ):
 
 AllocateIdsAsync = datastore.AllocateIdsAsync
 AllocateIds = datastore.AllocateIds
-RunInTransaction = datastore.RunInTransaction
-RunInTransactionCustomRetries = datastore.RunInTransactionCustomRetries
-RunInTransactionOptions = datastore.RunInTransactionOptions
+
+def _runTransaction( runner, *args, **kwargs ):
+	"""
+		Runs a transaction using *runner* (ie. datastore.RunInTransaction).
+
+		Sends the calls queued by the :class:`AutoBatcher` first, and invalidates the cached query
+		results for all kinds written once the transaction has been committed.
+	"""
+	flushAutoBatcher()
+	if getattr( __transactionKinds__, "kinds", None ) is not None: # The outer transaction takes care of that
+		return( runner( *args, **kwargs ) )
+	__transactionKinds__.kinds = set()
+	try:
+		return( runner( *args, **kwargs ) )
+	finally:
+		kinds = __transactionKinds__.kinds
+		__transactionKinds__.kinds = None
+		_bumpKindGenerations( kinds )
+
+def RunInTransaction( *args, **kwargs ):
+	"""
+		Like datastore.RunInTransaction, but sends the calls queued by the :class:`AutoBatcher` first
+		and invalidates the cached query results for the kinds written after committing.
+	"""
+	return( _runTransaction( datastore.RunInTransaction, *args, **kwargs ) )
+
+def RunInTransactionCustomRetries( *args, **kwargs ):
+	"""
+		Like datastore.RunInTransactionCustomRetries, but sends the calls queued by the :class:`AutoBatcher` first
+		and invalidates the cached query results for the kinds written after committing.
+	"""
+	return( _runTransaction( datastore.RunInTransactionCustomRetries, *args, **kwargs ) )
+
+def RunInTransactionOptions( *args, **kwargs ):
+	"""
+		Like datastore.RunInTransactionOptions, but sends the calls queued by the :class:`AutoBatcher` first
+		and invalidates the cached query results for the kinds written after committing.
+	"""
+	return( _runTransaction( datastore.RunInTransactionOptions, *args, **kwargs ) )
+
 TransactionOptions = datastore_rpc.TransactionOptions
 
 Key = datastore_types.Key
@@ -5,7 +5,7 @@ from datetime import datetime
 
 from server import db, request, errors, conf, exposed, utils
 from server.bones import *
-from server.skeleton import BaseSkeleton, skeletonByKind, listKnownSkeletons
+from server.skeleton import BaseSkeleton, skeletonByKind, listKnownSkeletons, prefetchReferencedEntities
 from server.tasks import CallableTask, CallableTaskBase, callDeferred
 
 from server.prototypes.hierarchy import HierarchySkel
@@ -503,6 +503,7 @@ def iterImport(module, target, exportKey, cursor=None, amount=0):
 
 			return
 
+		importedSkels = []
 		for entry in res["values"]:
 			for k in list(entry.keys())[:]:
 				if isinstance(entry[k], str):
@@ -548,9 +549,15 @@ def iterImport(module, target, exportKey, cursor=None, amount=0):
 
 
 			db.Put(dbEntry)
+			skel = skeletonByKind(module)()
 			skel.fromDB(str(dbEntry.key()))
+			importedSkels.append(skel)
+			amount += 1
+
+		# Refresh the imported entries once all of them are stored, fetching everything they reference at once
+		prefetchReferencedEntities(importedSkels)
+		for skel in importedSkels:
 			skel.refresh()
 			skel.toDB(clearUpdateTag=True)
-			amount += 1
 
 		iterImport(module, target, exportKey, res["cursor"], amount)
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import logging
 import json
+import pickle
 from datetime import datetime
 from hashlib import sha256
+from collections import OrderedDict
+from google.appengine.api import memcache
 from server import db
+from server.tasks import callDeferred
 
 class IndexMannager:
 	"""
@@ -18,22 +22,33 @@ class IndexMannager:
 			refreshIndex for each affected Index. As long as you can name them, their number is
 			limited and everything is fine :)
 
+		Indexes are built in a deferred task. Until an index is available, only the first page is
+		served; while an outdated index is rebuilt, the outdated one is served.
+
+		Queries merging several sub-queries (IN, != filters etc.) can't be indexed, only their first
+		page is served.
+
 	"""
 
 	_dbType = "viur_indexes"
+	_buildLockNamespace = "viur-index-builds"
+	buildLockTime = 60 #Don't schedule another build of the same index within 60 seconds
 
-	def __init__(self, pageSize=10, maxPages=100):
+	def __init__(self, pageSize=10, maxPages=100, cacheSize=100):
 		"""
 		:param pageSize: How many items per page
 		:type pageSkel: int
 		:param maxPages: How many pages are build. Items become unreachable if the amount of items
 			exceed pageSize*maxPages (ie. if a forum-thread has more than pageSize*maxPages Posts, Posts
 			after that barrier won't show up).
+		:param cacheSize: How many indexes are kept in memory (the least recently used ones are dropped).
+		:type cacheSize: int
 		:return:
 		"""
 		self.pageSize = pageSize
 		self.maxPages = maxPages
-		self._cache = {}
+		self.cacheSize = cacheSize
+		self._cache = OrderedDict()
 
 	def keyFromQuery(self, query ):
 		"""
@@ -55,46 +70,130 @@ class IndexMannager:
 
 	def getOrBuildIndex(self, origQuery ):
 		"""
-			Builds a specific index based on origQuery AND local variables (self.indexPage and self.indexMaxPage)
+			Returns the index for origQuery, based on local variables (self.pageSize and self.maxPages).
 			Returns a list of starting-cursors for each page.
 			You probably shouldn't call this directly. Use cursorForQuery.
 
+			If that index doesn't exist yet or is outdated, it's (re-)built in a deferred task. Meanwhile,
+			the outdated index (or just the first page, if there's none) is returned.
+
 			:param origQuery: Query to build the index for
 			:type origQuery: db.Query
-			:param key: DB-Key to save the index to
-			:type key: string
 			:returns: []
 		"""
+		if not self.canIndex( origQuery ):
+			return( [ None ] ) #Just serve the first page
 		key = self.keyFromQuery( origQuery )
 		if key in self._cache: #We have it cached
-			return( self._cache[ key ] )
+			res = self._cache.pop( key ) #Mark it as recently used
+			self._cache[ key ] = res
+			return( res )
 		#We dont have it cached - try to load it from DB
 		try:
 			index = db.Get( db.Key.from_path( self._dbType, key ) )
+		except db.EntityNotFoundError: #Its not in the datastore, too
+			index = None
+		if index is not None and not index.get( "stale" ):
 			res = json.loads( index["data"] )
-			self._cache[ key ] = res
+			self._cacheIndex( key, res )
 			return( res )
-		except db.EntityNotFoundError: #Its not in the datastore, too
-			pass
-		#We dont have this index yet.. Build it
-		#Clone the original Query
-		queryRes = origQuery.clone( keysOnly=True ).datastoreQuery.Run( limit=self.maxPages*self.pageSize )
-		#Build-Up the index
-		res = [ ]
-		i = 0
-		previousCursor = None #The first page dosnt have any cursor
-		for discardedKey in queryRes:
-			if i%self.pageSize==0:
-				res.append( previousCursor )
-			if i%self.pageSize==(self.pageSize-1) and i>1:
-				previousCursor = str( queryRes.cursor().urlsafe() )
-			i += 1
+		#We dont have a current index.. Let it build and serve what we have meanwhile
+		self._scheduleBuild( key, origQuery )
+		if index is not None:
+			return( json.loads( index["data"] ) )
+		return( [ None ] ) #The first page dosnt have any cursor
+
+	def _cacheIndex(self, key, index ):
+		"""
+			Keeps *index* in memory, dropping the least recently used indexes if we hold more than self.cacheSize.
+		"""
+		self._cache.pop( key, None )
+		self._cache[ key ] = index
+		while len( self._cache ) > self.cacheSize:
+			self._cache.popitem( last=False )
+
+	def canIndex(self, query ):
+		"""
+			Tests if an index can be built for *query*.
+
+			Only kind, filters, orders and ancestor of a query are passed to the deferred task building
+			its index, which isn't sufficient for queries merging several sub-queries.
+
+			:param query: Query to test
+			:type query: db.Query
+			:rtype: bool
+		"""
+		return( not isinstance( query.datastoreQuery, db.MultiQuery ) and not query._customMultiQueryMerge )
+
+	def _scheduleBuild(self, key, query, incremental=False, force=False ):
+		"""
+			Starts a deferred task (re-)building the index *key* for *query*.
+
+			Unless *force* is set, no task is started if another one has been started for that index
+			within the last self.buildLockTime seconds.
+
+			:raises: :exc:`NotImplementedError` if *query* can't be indexed (see canIndex).
+		"""
+		if not self.canIndex( query ):
+			raise NotImplementedError("Queries merging several sub-queries can't be indexed")
+		if force:
+			memcache.set( key, True, time=self.buildLockTime, namespace=self._buildLockNamespace )
+		elif not memcache.add( key, True, time=self.buildLockTime, namespace=self._buildLockNamespace ):
+			return
+		querySpec = pickle.dumps( ( query.getKind(), query.getFilter(), query.getOrders(), query.getAncestor() ) ).encode( "HEX" )
+		buildIndexTask( self._dbType, key, querySpec, self.pageSize, self.maxPages, incremental )
+
+	def buildIndex(self, key, query, incremental=False ):
+		"""
+			Builds the index *key* for *query* and stores it in the datastore.
+			Called from a deferred task (see getOrBuildIndex and refreshIndex).
+
+			:param key: DB-Key to save the index to
+			:type key: string
+			:param query: Query to build the index for
+			:type query: db.Query
+			:param incremental: Just append the pages of entities added behind the end of the existing
+				index, instead of rebuilding it from scratch.
+			:type incremental: bool
+		"""
+		dbKey = db.Key.from_path( self._dbType, key )
+		res = []
+		count = 0
+		startCursor = None
+		if incremental:
+			try:
+				index = db.Get( dbKey )
+			except db.EntityNotFoundError:
+				index = None
+			if index is not None and not index.get( "stale" ) and index.get( "tailCursor" ) and index.get( "count" ) is not None:
+				res = json.loads( index["data"] )
+				count = index["count"]
+				startCursor = index["tailCursor"]
+		remaining = self.maxPages*self.pageSize - count
+		if remaining > 0:
+			queryRes = query.clone( keysOnly=True ).datastoreQuery.Run( limit=remaining,
+					start_cursor=db.Cursor( urlsafe=startCursor ) if startCursor else None )
+			previousCursor = startCursor #The first page dosnt have any cursor
+			for discardedKey in queryRes:
+				if count%self.pageSize==0:
+					res.append( previousCursor )
+				count += 1
+				if count%self.pageSize==0:
+					previousCursor = str( queryRes.cursor().urlsafe() )
+			try: #Remember where we stopped, so entities added later can be appended
+				startCursor = str( queryRes.cursor().urlsafe() )
+			except ( AssertionError, db.BadArgumentError ):
+				startCursor = None
 		if len( res ) == 0: # Ensure that the first page exists
 			res.append( None )
 		entry = db.Entity( self._dbType, name=key )
 		entry[ "data" ] = json.dumps( res )
 		entry[ "creationdate" ] = datetime.now()
+		entry[ "stale" ] = False
+		entry[ "count" ] = count
+		entry[ "tailCursor" ] = startCursor
 		db.Put( entry )
+		self._cacheIndex( key, res )
 		return( res )
 
 	def cursorForQuery(self, query, page ):
@@ -128,18 +227,47 @@ class IndexMannager:
 		"""
 		return( self.getOrBuildIndex( query ) )
 
-	def refreshIndex(self, query ):
+	def refreshIndex(self, query, appendOnly=False ):
 		"""
 			Refreshes the Index for the given query
-			(Actually it removes it from the db so it gets rebuild on next use)
+			(Actually it marks it as outdated and rebuilds it in a deferred task, the outdated
+			index is served until then)
 
 			:param query: Query for which the index should be refreshed
 			:type query: db.Query
+			:param appendOnly: Set this if entities have only been added behind all existing results
+				of that query (ie. new posts in a forum-thread sorted by creationdate). The pages for these
+				entities are appended to the index, instead of rebuilding it.
+			:type appendOnly: bool
 		"""
+		if not self.canIndex( query ): #There's no index for such queries
+			return
 		key = self.keyFromQuery( query )
-		try:
-			db.Delete( db.Key.from_path( self._dbType, key ) )
-		except db.EntityNotFoundError:
-			pass
-		if key in self._cache:
-			del self._cache[ key ]
+		if not appendOnly:
+			try:
+				index = db.Get( db.Key.from_path( self._dbType, key ) )
+				index[ "stale" ] = True
+				db.Put( index )
+			except db.EntityNotFoundError:
+				pass
+		self._cache.pop( key, None )
+		self._scheduleBuild( key, query, incremental=appendOnly, force=True )
+
+
+@callDeferred
+def buildIndexTask( dbType, key, querySpec, pageSize, maxPages, incremental ):
+	"""
+		Deferred task (re-)building an index of :class:`IndexMannager`.
+
+		:param querySpec: Kind, filters, orders and ancestor of the query, pickled and hex-encoded
+		:type querySpec: str
+	"""
+	kind, filters, orders, ancestor = pickle.loads( querySpec.decode( "HEX" ) )
+	query = db.Query( kind ).filter( filters )
+	if orders:
+		query.order( *orders )
+	if ancestor is not None:
+		query.ancestor( ancestor )
+	indexMannager = IndexMannager( pageSize, maxPages )
+	indexMannager._dbType = dbType
+	indexMannager.buildIndex( key, query, incremental )
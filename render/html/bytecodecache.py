@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from jinja2 import BytecodeCache
+from jinja2.bccache import Bucket
+from google.appengine.api import memcache
+from hashlib import sha1
+import os, logging
+
+
+class InstanceBytecodeCache( BytecodeCache ):
+	"""
+		Keeps compiled templates in memory, shared by the Jinja2 environments of all renders.
+
+		Without a bytecode cache, each environment (there's one per module) compiles each template
+		on its own. This cache is used unless ``conf["viur.render.html.bytecodeCache"]`` is set.
+		Subclasses add a second tier, which is only asked if a template isn't in memory yet.
+
+		As ``Render.jinjaEnv()`` may customize the environment of each module, the settings affecting
+		how templates are compiled are part of the cache key; only environments configured alike
+		share their compiled templates.
+	"""
+	_compiledTemplates = {} # Shared by all instances
+
+	def get_bucket( self, environment, name, filename, source ):
+		"""
+			Like BytecodeCache.get_bucket, but includes the configuration of *environment* in the key.
+		"""
+		key = sha1( "%s|%s" % ( self.get_cache_key( name, filename ), self.getEnvironmentKey( environment ) ) ).hexdigest()
+		bucket = Bucket( environment, key, self.get_source_checksum( source ) )
+		self.load_bytecode( bucket )
+		return( bucket )
+
+	def getEnvironmentKey( self, environment ):
+		"""
+			Describes the settings of *environment* which affect the code generated for a template.
+			This must be the same on each instance for environments configured alike.
+
+			:rtype: str
+		"""
+		def describe( value ):
+			if callable( value ): # ie. an autoescape function
+				return( "%s.%s" % ( getattr( value, "__module__", "" ), getattr( value, "__name__", type( value ).__name__ ) ) )
+			return( repr( value ) )
+		settings = [ describe( getattr( environment, x, None ) ) for x in [
+				"block_start_string", "block_end_string", "variable_start_string", "variable_end_string",
+				"comment_start_string", "comment_end_string", "line_statement_prefix", "line_comment_prefix",
+				"trim_blocks", "lstrip_blocks", "newline_sequence", "keep_trailing_newline", "autoescape", "optimized" ] ]
+		settings.append( ",".join( sorted( environment.extensions.keys() ) ) )
+		settings.append( ",".join( sorted( environment.filters.keys() ) ) )
+		settings.append( ",".join( sorted( environment.tests.keys() ) ) )
+		return( sha1( "|".join( settings ) ).hexdigest() )
+
+	def get_cache_key( self, name, filename=None ):
+		"""
+			Builds the key from the template name and its path relative to our application,
+			so the same keys are used on each instance (and for bundles generated elsewhere).
+		"""
+		if filename is not None:
+			filename = os.path.relpath( filename, os.getcwd() )
+		return( super( InstanceBytecodeCache, self ).get_cache_key( name, filename ) )
+
+	def load_bytecode( self, bucket ):
+		code = InstanceBytecodeCache._compiledTemplates.get( bucket.key )
+		if code is None:
+			code = self.loadBytecodeString( bucket.key )
+			if code is not None:
+				InstanceBytecodeCache._compiledTemplates[ bucket.key ] = code
+		if code is not None:
+			# Jinja2 discards that code if the template has been changed since
+			bucket.bytecode_from_string( code )
+
+	def dump_bytecode( self, bucket ):
+		code = bucket.bytecode_to_string()
+		InstanceBytecodeCache._compiledTemplates[ bucket.key ] = code
+		self.dumpBytecodeString( bucket.key, code )
+
+	def loadBytecodeString( self, key ):
+		"""
+			Fetches the compiled template stored under *key* from the second tier.
+
+			:returns: The compiled template as returned by dumpBytecodeString, or None.
+			:rtype: str | None
+		"""
+		return( None )
+
+	def dumpBytecodeString( self, key, code ):
+		"""
+			Stores the compiled template *code* under *key* in the second tier.
+		"""
+		pass
+
+
+class MemcacheBytecodeCache( InstanceBytecodeCache ):
+	"""
+		Stores compiled templates in memcache, so they're compiled only once for all instances.
+
+		Usage (in your main.py)::
+
+			conf["viur.render.html.bytecodeCache"] = MemcacheBytecodeCache()
+	"""
+	def __init__( self, namespace="viur-jinja2-bytecode", cacheTime=0 ):
+		"""
+			:param namespace: Memcache namespace to store the compiled templates in.
+			:type namespace: str
+			:param cacheTime: Seconds to keep a compiled template in memcache, 0 means no expiration.
+			:type cacheTime: int
+		"""
+		super( MemcacheBytecodeCache, self ).__init__()
+		self.namespace = namespace
+		self.cacheTime = cacheTime
+
+	def loadBytecodeString( self, key ):
+		try:
+			return( memcache.get( key, namespace=self.namespace ) )
+		except: # Memcache unavailable, just compile that template
+			return( None )
+
+	def dumpBytecodeString( self, key, code ):
+		try:
+			memcache.set( key, code, time=self.cacheTime, namespace=self.namespace )
+		except: # Too large or memcache unavailable
+			logging.warning( "Could not store the compiled template %s in memcache" % key )
+
+
+class BundleBytecodeCache( InstanceBytecodeCache ):
+	"""
+		Reads compiled templates from a bundle generated at deploy time.
+
+		The bundle is a directory containing one file for each template. Create it by running
+		:meth:`build` (ie. from a script executed on the development server) before deploying, and
+		upload that directory with your application. Templates missing or outdated in that bundle
+		are compiled (and kept in memory) as usual.
+
+		Usage (in your main.py)::
+
+			conf["viur.render.html.bytecodeCache"] = BundleBytecodeCache("templates_compiled")
+	"""
+	def __init__( self, directory ):
+		"""
+			:param directory: Path of the bundle, relative to the application.
+			:type directory: str
+		"""
+		super( BundleBytecodeCache, self ).__init__()
+		self.directory = directory
+
+	def _getFileName( self, key ):
+		return( os.path.join( os.getcwd(), self.directory, "%s.cache" % key ) )
+
+	def loadBytecodeString( self, key ):
+		try:
+			with open( self._getFileName( key ), "rb" ) as f:
+				return( f.read() )
+		except IOError: # Not part of the bundle
+			return( None )
+
+	def dumpBytecodeString( self, key, code ):
+		pass # The bundle is read-only at runtime
+
+	@staticmethod
+	def build( env, directory ):
+		"""
+			Compiles all templates available to the Jinja2 environment *env* into a bundle.
+
+			:param env: The environment to compile the templates for, ie. ``Render().getEnv()``.
+			:type env: jinja2.Environment
+			:param directory: Path of the bundle to (re-)create, relative to the application.
+			:type directory: str
+
+			:returns: The number of templates compiled.
+			:rtype: int
+		"""
+		target = os.path.join( os.getcwd(), directory )
+		if not os.path.isdir( target ):
+			os.makedirs( target )
+		bytecodeCache = InstanceBytecodeCache()
+		count = 0
+		for name in env.list_templates( extensions=["html"] ):
+			source, filename, uptodate = env.loader.get_source( env, name )
+			bucket = bytecodeCache.get_bucket( env, name, filename, source )
+			bucket.code = env.compile( source, name, filename )
+			with open( os.path.join( target, "%s.cache" % bucket.key ), "wb" ) as f:
+				f.write( bucket.bytecode_to_string() )
+			count += 1
+		return( count )
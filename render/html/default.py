@@ -1,16 +1,48 @@
 # -*- coding: utf-8 -*-
 import utils as jinjaUtils
-from wrap import ListWrapper, SkelListWrapper
+from wrap import ListWrapper, SkelListWrapper, LazySkelListWrapper
 
-from server import utils, request, errors, securitykey
-from server.skeleton import Skeleton, BaseSkeleton, RefSkel, skeletonByKind
+from server import utils, request, errors, securitykey, conf
+from server.skeleton import Skeleton, BaseSkeleton, RefSkel, skeletonByKind, getBoneHandlers
 from server.bones import *
 
 from collections import OrderedDict
 from jinja2 import Environment, FileSystemLoader, ChoiceLoader
+from bytecodecache import InstanceBytecodeCache
 
 import os, logging, codecs
 
+_instanceBytecodeCache = InstanceBytecodeCache() # Used unless conf["viur.render.html.bytecodeCache"] is set
+_templateDirIndex = {} # Template directory -> set of all files below it
+_templateFileNames = {} # (htmlpath, template, style, language) -> Filename returned by getTemplateFileName
+_isDevelopmentServer = "Development" in os.environ.get("SERVER_SOFTWARE", "")
+
+def _templateExists(directory, fn):
+	"""
+		Checks if the file *fn* exists in the template directory *directory*.
+
+		On production, the directory is scanned only once and looked up from memory afterwards
+		(the application can't change its files there). The development server checks the
+		filesystem each time, so new templates are found immediately.
+	"""
+	if _isDevelopmentServer:
+		return os.path.isfile(os.path.join(os.getcwd(), directory, fn))
+	directory = os.path.normpath(directory)
+	if not directory in _templateDirIndex:
+		files = set()
+		base = os.path.join(os.getcwd(), directory)
+		visited = set()
+		for root, dirs, fileNames in os.walk(base, followlinks=True): # Templates might live in symlinked directories
+			realRoot = os.path.realpath(root)
+			if realRoot in visited: # Symlinked back to a directory we've already been to
+				dirs[:] = []
+				continue
+			visited.add(realRoot)
+			for fileName in fileNames:
+				files.add(os.path.relpath(os.path.join(root, fileName), base))
+		_templateDirIndex[directory] = frozenset(files)
+	return os.path.normpath(fn) in _templateDirIndex[directory]
+
 class Render( object ):
 	"""
 		The core jinja2 render.
@@ -119,10 +151,7 @@ class Render( object ):
 			:rtype: str
 		"""
 		validChars = "abcdefghijklmnopqrstuvwxyz1234567890-"
-		if "htmlpath" in dir( self ):
-			htmlpath = self.htmlpath
-		else:
-			htmlpath = "html"
+		htmlpath = getattr( self, "htmlpath", "html" )
 		if not ignoreStyle\
 			and "style" in request.current.get().kwargs\
 			and all( [ x in validChars for x in request.current.get().kwargs["style"].lower() ] ):
@@ -130,6 +159,20 @@ class Render( object ):
 		else:
 			stylePostfix = ""
 		lang = request.current.get().language #session.current.getLanguage()
+		cacheKey = ( htmlpath, template, stylePostfix, lang )
+		if not _isDevelopmentServer and cacheKey in _templateFileNames:
+			return( _templateFileNames[ cacheKey ] )
+		res = self._findTemplateFileName( htmlpath, template, stylePostfix, lang )
+		if not _isDevelopmentServer:
+			if len( _templateFileNames ) >= 1000: # Styles are client-supplied, don't let them grow this unbounded
+				_templateFileNames.clear()
+			_templateFileNames[ cacheKey ] = res
+		return( res )
+
+	def _findTemplateFileName( self, htmlpath, template, stylePostfix, lang ):
+		"""
+			Searches the filename of the template for :func:`getTemplateFileName`.
+		"""
 		fnames = [ template+stylePostfix+".html", template+".html" ]
 		if lang:
 			fnames = [ 	os.path.join(  lang, template+stylePostfix+".html"),
@@ -138,14 +181,14 @@ class Render( object ):
 						template+".html" ]
 		for fn in fnames: #check subfolders
 			prefix = template.split("_")[0]
-			if os.path.isfile(os.path.join(os.getcwd(), "html", prefix, fn)):
+			if _templateExists( "html", os.path.join( prefix, fn ) ):
 				return ( "%s/%s" % (prefix, fn ) )
 		for fn in fnames: #Check the templatefolder of the application
-			if os.path.isfile( os.path.join( os.getcwd(), htmlpath, fn ) ):
+			if _templateExists( htmlpath, fn ):
 				self.checkForOldLinePrefix( os.path.join( os.getcwd(), htmlpath, fn ) )
 				return( fn )
 		for fn in fnames: #Check the fallback
-			if os.path.isfile( os.path.join( os.getcwd(), "server", "template", fn ) ):
+			if _templateExists( os.path.join( "server", "template" ), fn ):
 				self.checkForOldLinePrefix( os.path.join( os.getcwd(), "server", "template", fn ) )
 				return( fn )
 		raise errors.NotFound( "Template %s not found." % template )
@@ -300,63 +343,79 @@ class Render( object ):
 		:return: A dict containing the rendered attributes.
 		:rtype: dict
 		"""
+		renderFunc = self.getBoneValueRenderer(bone)
+		if renderFunc is None:
+			return skel[key]
+		return renderFunc(self, bone, skel[key])
+
+	def getBoneValueRenderer(self, bone):
+		"""
+		Chooses the function rendering the values of *bone*.
+
+		:func:`collectSkelData` remembers the result for each bone of a skeleton class,
+		so it can render the values of many entries without inspecting their bones again.
+
+		:param bone: The bone which values should be rendered.
+		:type bone: Any bone that inherits from :class:`server.bones.base.baseBone`.
+
+		:return: An unbound method of this render, taking (bone, value), or None if the value
+			is used as it is.
+		"""
 		if bone.type == "select" or bone.type.startswith("select."):
-			skelValue = skel[key]
-			if isinstance(skelValue, list):
-				return [
-					Render.KeyValueWrapper(val, bone.values[val]) if val in bone.values else val
-					for val in skelValue
-				]
-			elif skelValue in bone.values:
-				return Render.KeyValueWrapper(skelValue, bone.values[skelValue])
-			return skelValue
+			return type(self).renderSelectBoneValue
 		elif bone.type=="relational" or bone.type.startswith("relational."):
-			if isinstance(skel[key], list):
-				tmpList = []
-				for k in skel[key]:
-					refSkel = bone._refSkelCache
-					refSkel.setValuesCache(k["dest"])
-					if bone.using is None:
-						tmpList.append(self.collectSkelData(refSkel))
-					else:
-						usingSkel = bone._usingSkelCache
-						if k["rel"]:
-							usingSkel.setValuesCache(k["rel"])
-							usingData = self.collectSkelData(usingSkel)
-						else:
-							usingData = None
-						tmpList.append({
-							"dest": self.collectSkelData(refSkel),
-			                                "rel": usingData
-						})
-				return tmpList
-			elif isinstance(skel[key], dict):
+			return type(self).renderRelationalBoneValue
+		return None
+
+	def renderSelectBoneValue(self, bone, skelValue):
+		if isinstance(skelValue, list):
+			return [
+				Render.KeyValueWrapper(val, bone.values[val]) if val in bone.values else val
+				for val in skelValue
+			]
+		elif skelValue in bone.values:
+			return Render.KeyValueWrapper(skelValue, bone.values[skelValue])
+		return skelValue
+
+	def renderRelationalBoneValue(self, bone, skelValue):
+		if isinstance(skelValue, list):
+			tmpList = []
+			for k in skelValue:
 				refSkel = bone._refSkelCache
-				refSkel.setValuesCache(skel[key]["dest"])
+				refSkel.setValuesCache(k["dest"])
 				if bone.using is None:
-					return self.collectSkelData(refSkel)
+					tmpList.append(self.collectSkelData(refSkel))
 				else:
 					usingSkel = bone._usingSkelCache
-					if skel[key]["rel"]:
-						usingSkel.setValuesCache(skel[key]["rel"])
+					if k["rel"]:
+						usingSkel.setValuesCache(k["rel"])
 						usingData = self.collectSkelData(usingSkel)
 					else:
 						usingData = None
-
-					return {
+					tmpList.append({
 						"dest": self.collectSkelData(refSkel),
-						"rel": usingData
-					}
+		                                "rel": usingData
+					})
+			return tmpList
+		elif isinstance(skelValue, dict):
+			refSkel = bone._refSkelCache
+			refSkel.setValuesCache(skelValue["dest"])
+			if bone.using is None:
+				return self.collectSkelData(refSkel)
 			else:
-				return None
-		else:
-			#logging.error("RETURNING")
-			#logging.error((skel[key]))
-			return skel[key]
+				usingSkel = bone._usingSkelCache
+				if skelValue["rel"]:
+					usingSkel.setValuesCache(skelValue["rel"])
+					usingData = self.collectSkelData(usingSkel)
+				else:
+					usingData = None
 
+				return {
+					"dest": self.collectSkelData(refSkel),
+					"rel": usingData
+				}
 		return None
 
-
 	def collectSkelData(self, skel):
 		"""
 			Prepares values of one :class:`server.db.skeleton.Skeleton` or a list of skeletons for output.
@@ -371,11 +430,23 @@ class Render( object ):
 		if isinstance(skel, list):
 			return [self.collectSkelData(x) for x in skel]
 		res = {}
-		for key, bone in skel.items():
-			val = self.renderBoneValue(bone, skel, key)
+		renderCls = type(self)
+		if renderCls.renderBoneValue.im_func is not Render.renderBoneValue.im_func:
+			# renderBoneValue has been overridden, so it must be called for each bone
+			for key, bone in skel.items():
+				val = self.renderBoneValue(bone, skel, key)
+				if isinstance(val, list):
+					val = ListWrapper(val)
+				res[key] = val
+			return res
+		values = skel.valuesCache
+		for key, bone, renderFunc in getBoneHandlers(skel, renderCls, self.getBoneValueRenderer):
+			val = values.get(key)
+			if renderFunc is not None:
+				val = renderFunc(self, bone, val)
+			if isinstance(val, list):
+				val = ListWrapper(val)
 			res[key] = val
-			if isinstance(res[key], list):
-				res[key] = ListWrapper(res[key])
 		return res
 
 	def add(self, skel, tpl=None, params=None, *args, **kwargs):
@@ -556,8 +627,8 @@ class Render( object ):
 			:param params: Optional data that will be passed unmodified to the template
 			:type params: object
 
-			:return: Returns the emitted HTML response.
-			:rtype: str
+			:return: Returns the emitted HTML response, or a generator of its chunks if viur.render.streamLists is set.
+			:rtype: str | generator
 		"""
 		if not tpl and "listTemplate" in dir( self.parent ):
 			tpl = self.parent.listTemplate
@@ -567,6 +638,8 @@ class Render( object ):
 		except errors.HTTPException as e: #Not found - try default fallbacks FIXME: !!!
 			tpl = "list"
 		template = self.getEnv().get_template( self.getTemplateFileName( tpl ) )
+		if conf["viur.render.streamLists"] and not request.current.get().internalRequest:
+			return template.generate(skellist=LazySkelListWrapper(skellist, self.collectSkelData), params=params, **kwargs)
 		resList = []
 		for skel in skellist:
 			resList.append( self.collectSkelData(skel) )
@@ -887,6 +960,12 @@ class Render( object ):
 			If an application specifies an jinja2Env function, this function
 			can alter the environment before its used to parse any template.
 
+			Compiled templates are shared between the environments of all renders
+			through the bytecode cache set in ``conf["viur.render.html.bytecodeCache"]``.
+			The environments themselves are not shared: Their global functions and filters
+			are bound to this render (and its module), and each module may use its own loaders
+			(see :func:`getLoaders`) and customize its environment in ``jinjaEnv()``.
+
 			:returns: Extended Jinja2 environment.
 			:rtype: jinja2.Environment
 		"""
@@ -895,7 +974,8 @@ class Render( object ):
 
 		if not "env" in dir(self):
 			loaders = self.getLoaders()
-			self.env = Environment(loader=loaders, extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"])
+			self.env = Environment(loader=loaders, extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"],
+			                       bytecode_cache=conf["viur.render.html.bytecodeCache"] or _instanceBytecodeCache)
 
 			# Translation remains global
 			self.env.globals["_"] = _
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from server import utils, request, conf, prototypes, securitykey, errors
+from server import utils, request, conf, prototypes, securitykey, errors, getRoutingTable
 from server.skeleton import Skeleton, RelSkel
 from server.render.html.utils import jinjaGlobalFunction, jinjaGlobalFilter
 from server.render.html.wrap import ListWrapper, SkelListWrapper
@@ -12,6 +12,44 @@ import string
 import logging
 import os
 
+__execRequestMemoKey__ = "viur-execRequest-memo" #Key of the per-request memo in request.current.requestData()
+__execRequestPrefetchKey__ = "viur-execRequest-prefetch" #Key of the prefetched memcache results in requestData()
+__execRequestKnownUrls__ = 500 #Max. amount of urls we remember cacheable execRequest calls for
+__execRequestKnownKeys__ = 50 #Max. amount of cacheable execRequest calls remembered per url
+_knownCacheKeys = OrderedDict() #Url -> set of memcache keys of cacheable execRequest calls made while rendering it
+
+def _getCachedResult(cacheKey):
+	"""
+		Looks up the cached result of an execRequest call.
+
+		On the first lookup within a request, the results of all cacheable calls seen while rendering
+		the same url before are fetched as well, using a single memcache.get_multi().
+		The remaining calls of that template are then served without another memcache round trip.
+
+		:returns: The cached result, or None if there is none.
+	"""
+	reqData = request.current.requestData()
+	url = request.current.get().request.path
+	if not __execRequestPrefetchKey__ in reqData:
+		keys = set(_knownCacheKeys.get(url, []))
+		keys.add(cacheKey)
+		reqData[__execRequestPrefetchKey__] = (keys, memcache.get_multi(list(keys)))
+	queriedKeys, prefetched = reqData[__execRequestPrefetchKey__]
+	# Remember this call for prefetching on the next render of that url
+	knownKeys = _knownCacheKeys.get(url)
+	if knownKeys is None:
+		while len(_knownCacheKeys) >= __execRequestKnownUrls__:
+			try:
+				_knownCacheKeys.popitem(last=False)
+			except KeyError: #Emptied by another thread
+				break
+		knownKeys = _knownCacheKeys.setdefault(url, set())
+	if len(knownKeys) < __execRequestKnownKeys__:
+		knownKeys.add(cacheKey)
+	if cacheKey in queriedKeys:
+		return prefetched.get(cacheKey)
+	return memcache.get(cacheKey)
+
 @jinjaGlobalFunction
 def execRequest(render, path, *args, **kwargs):
 	"""
@@ -20,6 +58,9 @@ def execRequest(render, path, *args, **kwargs):
 	This function allows to embed the result of another request inside the current template.
 	All optional parameters are passed to the requested resource.
 
+	Unless caching is disabled, identical calls within one request are only performed once.
+	Results of calls having a *cachetime* are also stored in memcache.
+
 	:param path: Local part of the url, e.g. user/list. Must not start with an /.
 	Must not include an protocol or hostname.
 	:type path: str
@@ -32,8 +73,13 @@ def execRequest(render, path, *args, **kwargs):
 	else:
 		cachetime = 0
 
-	if conf["viur.disableCache"] or request.current.get().disableCache: #Caching disabled by config
+	currentRequest = request.current.get()
+
+	memo = None
+	if conf["viur.disableCache"] or currentRequest.disableCache: #Caching disabled by config
 		cachetime = 0
+	else:
+		memo = request.current.requestData().setdefault(__execRequestMemoKey__, {})
 
 	cacheEnvKey = None
 	if conf["viur.cacheEnvironmentKey"]:
@@ -42,17 +88,22 @@ def execRequest(render, path, *args, **kwargs):
 		except RuntimeError:
 			cachetime = 0
 
+	#Calculate the key identifying this call
+	tmpList = ["%s:%s" % (unicode(k), unicode(v)) for k,v in kwargs.items()]
+	tmpList.sort()
+	tmpList.extend(list(args))
+	tmpList.append(path)
+	if cacheEnvKey is not None:
+		tmpList.append(cacheEnvKey)
+
+	memoKey = unicode(tmpList)
+	if memo is not None and memoKey in memo:
+		return memo[memoKey]
+
 	if cachetime:
 		#Calculate the cache key that entry would be stored under
-		tmpList = ["%s:%s" % (unicode(k), unicode(v)) for k,v in kwargs.items()]
-		tmpList.sort()
-		tmpList.extend(list(args))
-		tmpList.append(path)
-		if cacheEnvKey is not None:
-			tmpList.append(cacheEnvKey)
-
 		try:
-			appVersion = request.current.get().request.environ["CURRENT_VERSION_ID"].split('.')[0]
+			appVersion = currentRequest.request.environ["CURRENT_VERSION_ID"].split('.')[0]
 		except:
 			appVersion = ""
 			logging.error("Could not determine the current application id! Caching might produce unexpected results!")
@@ -61,35 +112,33 @@ def execRequest(render, path, *args, **kwargs):
 		mysha512 = sha512()
 		mysha512.update( unicode(tmpList).encode("UTF8") )
 		cacheKey = "jinja2_cache_%s" % mysha512.hexdigest()
-		res = memcache.get( cacheKey )
+		res = _getCachedResult( cacheKey )
 
 		if res:
+			if memo is not None:
+				memo[memoKey] = res
 			return res
 
-	currentRequest = request.current.get()
 	tmp_params = currentRequest.kwargs.copy()
 	currentRequest.kwargs = {"__args": args, "__outer": tmp_params}
 	currentRequest.kwargs.update( kwargs )
 	lastRequestState = currentRequest.internalRequest
 	currentRequest.internalRequest = True
-	caller = conf["viur.mainApp"]
+	node = getRoutingTable()
 	pathlist = path.split("/")
 
 	for currpath in pathlist:
-		if currpath in dir( caller ):
-			caller = getattr( caller,currpath )
-		elif "index" in dir( caller ) and  hasattr( getattr( caller, "index" ), '__call__'):
-			caller = getattr( caller, "index" )
+		if node.getChild( currpath ) is not None:
+			node = node.getChild( currpath )
+		elif node.getChild( "index" ) is not None and node.getChild( "index" ).isCallable:
+			node = node.getChild( "index" )
 		else:
 			currentRequest.kwargs = tmp_params # Reset RequestParams
 			currentRequest.internalRequest = lastRequestState
 			return( u"Path not found %s (failed Part was %s)" % ( path, currpath ) )
 
-	if (not hasattr(caller, '__call__')
-		or ((not "exposed" in dir( caller )
-			    or not caller.exposed))
-		and (not "internalExposed" in dir( caller )
-				or not caller.internalExposed)):
+	caller = node.target
+	if not node.isExposed( True ):
 		currentRequest.kwargs = tmp_params # Reset RequestParams
 		currentRequest.internalRequest = lastRequestState
 		return( u"%s not callable or not exposed" % str(caller) )
@@ -107,6 +156,8 @@ def execRequest(render, path, *args, **kwargs):
 	if cachetime:
 		memcache.set(cacheKey, resstr, cachetime)
 
+	if memo is not None:
+		memo[memoKey] = resstr
 	return resstr
 
 @jinjaGlobalFunction
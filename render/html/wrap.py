@@ -24,6 +24,29 @@ class ListWrapper( list ):
 				res.append( getattr( obj, key ) )
 		return( ListWrapper(res) )
 
+class LazySkelListWrapper( object ):
+	"""
+		Like SkelListWrapper, but prepares the entries only while they are iterated,
+		so they don't have to be kept in memory at once (see viur.render.streamLists).
+	"""
+	def __init__( self, skellist, collectSkelData ):
+		super( LazySkelListWrapper, self ).__init__()
+		self.skellist = skellist
+		self.collectSkelData = collectSkelData
+		self.cursor = skellist.cursor
+		self.customQueryInfo = skellist.customQueryInfo
+
+	def __iter__( self ):
+		for skel in self.skellist:
+			yield self.collectSkelData( skel )
+
+	def __len__( self ):
+		return( len( self.skellist ) )
+
+	def __getitem__( self, key ):
+		# Random access requires all entries anyway
+		return( ListWrapper( [ x for x in self ] )[ key ] )
+
 class SkelListWrapper(ListWrapper):
 	"""
 		Like ListWrapper, but takes the additional properties
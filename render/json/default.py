@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import json
 from collections import OrderedDict
-from server import errors, request, bones
-from server.skeleton import RefSkel, skeletonByKind
+from server import errors, request, bones, conf
+from server.skeleton import RefSkel, skeletonByKind, getBoneHandlers
 import logging
 
 class DefaultRender(object):
@@ -134,48 +134,71 @@ class DefaultRender(object):
 		:return: A dict containing the rendered attributes.
 		:rtype: dict
 		"""
-		if bone.type == "date" or bone.type.startswith("date."):
-			if skel[key]:
-				if bone.date and bone.time:
-					return skel[key].strftime("%d.%m.%Y %H:%M:%S")
-				elif bone.date:
-					return skel[key].strftime("%d.%m.%Y")
+		renderFunc = self.getBoneValueRenderer(bone)
+		if renderFunc is None:
+			return skel[key]
+		return renderFunc(self, bone, skel[key])
+
+	def getBoneValueRenderer(self, bone):
+		"""
+		Chooses the function rendering the values of *bone*.
+
+		:func:`renderSkelValues` remembers the result for each bone of a skeleton class,
+		so it can render the values of many entries without inspecting their bones again.
+
+		:param bone: The bone which values should be rendered.
+		:type bone: Any bone that inherits from :class:`server.bones.base.baseBone`.
 
-				return skel[key].strftime("%H:%M:%S")
+		:return: An unbound method of this render, taking (bone, value), or None if the value
+			is used as it is.
+		"""
+		if bone.type == "date" or bone.type.startswith("date."):
+			return type(self).renderDateBoneValue
 		elif isinstance(bone, bones.relationalBone):
-			if isinstance(skel[key], list):
-				refSkel = bone._refSkelCache
-				usingSkel = bone._usingSkelCache
-				tmpList = []
-				for k in skel[key]:
-					refSkel.setValuesCache(k["dest"])
-					if usingSkel:
-						usingSkel.setValuesCache(k.get("rel", {}))
-						usingData = self.renderSkelValues(usingSkel)
-					else:
-						usingData = None
-					tmpList.append({
-						"dest": self.renderSkelValues(refSkel),
-						"rel": usingData
-					})
-
-				return tmpList
-			elif isinstance(skel[key], dict):
-				refSkel = bone._refSkelCache
-				usingSkel = bone._usingSkelCache
-				refSkel.setValuesCache(skel[key]["dest"])
+			return type(self).renderRelationalBoneValue
+		return None
+
+	def renderDateBoneValue(self, bone, skelValue):
+		if skelValue:
+			if bone.date and bone.time:
+				return skelValue.strftime("%d.%m.%Y %H:%M:%S")
+			elif bone.date:
+				return skelValue.strftime("%d.%m.%Y")
+
+			return skelValue.strftime("%H:%M:%S")
+		return None
+
+	def renderRelationalBoneValue(self, bone, skelValue):
+		if isinstance(skelValue, list):
+			refSkel = bone._refSkelCache
+			usingSkel = bone._usingSkelCache
+			tmpList = []
+			for k in skelValue:
+				refSkel.setValuesCache(k["dest"])
 				if usingSkel:
-					usingSkel.setValuesCache(skel[key].get("rel", {}))
+					usingSkel.setValuesCache(k.get("rel", {}))
 					usingData = self.renderSkelValues(usingSkel)
 				else:
 					usingData = None
-				return {
+				tmpList.append({
 					"dest": self.renderSkelValues(refSkel),
 					"rel": usingData
-				}
-		else:
-			return skel[key]
-
+				})
+
+			return tmpList
+		elif isinstance(skelValue, dict):
+			refSkel = bone._refSkelCache
+			usingSkel = bone._usingSkelCache
+			refSkel.setValuesCache(skelValue["dest"])
+			if usingSkel:
+				usingSkel.setValuesCache(skelValue.get("rel", {}))
+				usingData = self.renderSkelValues(usingSkel)
+			else:
+				usingData = None
+			return {
+				"dest": self.renderSkelValues(refSkel),
+				"rel": usingData
+			}
 		return None
 
 	def renderSkelValues(self, skel):
@@ -194,8 +217,19 @@ class DefaultRender(object):
 			return skel
 
 		res = {}
-		for key, bone in skel.items():
-			res[key] = self.renderBoneValue(bone, skel, key)
+		renderCls = type(self)
+		if renderCls.renderBoneValue.im_func is not DefaultRender.renderBoneValue.im_func:
+			# renderBoneValue has been overridden, so it must be called for each bone
+			for key, bone in skel.items():
+				res[key] = self.renderBoneValue(bone, skel, key)
+			return res
+
+		values = skel.valuesCache
+		for key, bone, renderFunc in getBoneHandlers(skel, renderCls, self.getBoneValueRenderer):
+			if renderFunc is None:
+				res[key] = values.get(key)
+			else:
+				res[key] = renderFunc(self, bone, values.get(key))
 
 		return res
 
@@ -227,6 +261,9 @@ class DefaultRender(object):
 		return self.renderEntry(skel, action, params)
 
 	def list(self, skellist, action = "list", params=None, **kwargs):
+		if conf["viur.render.streamLists"] and not request.current.get().internalRequest:
+			request.current.get().response.headers["Content-Type"] = "application/json"
+			return self.streamList(skellist, action, params)
 		res = {}
 		skels = []
 
@@ -247,6 +284,24 @@ class DefaultRender(object):
 		request.current.get().response.headers["Content-Type"] = "application/json"
 		return json.dumps(res)
 
+	def streamList(self, skellist, action="list", params=None):
+		"""
+			Like list(), but encodes the entries one by one while the response is written.
+
+			:returns: Generator of the chunks of the JSON response.
+		"""
+		yield '{"skellist": ['
+		for idx, skel in enumerate(skellist):
+			if idx:
+				yield ', '
+			yield json.dumps(self.renderSkelValues(skel))
+		if skellist:
+			structure = self.renderSkelStructure(skellist.baseSkel)
+		else:
+			structure = None
+		yield '], "structure": %s, "cursor": %s, "action": %s, "params": %s}' % (
+			json.dumps(structure), json.dumps(skellist.cursor), json.dumps(action), json.dumps(params))
+
 	def editItemSuccess(self, skel, params=None, **kwargs):
 		return self.renderEntry(skel, "editSuccess", params)
 		
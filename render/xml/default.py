@@ -1,48 +1,93 @@
 # -*- coding: utf-8 -*-
 from server.bones import *
+from server.skeleton import getBoneHandlers
 from collections import OrderedDict
 from xml.dom import minidom
 from datetime import datetime, date, time
-
-def serializeXML( data ):
-	def recursiveSerializer( data, element ):
-		if isinstance(data, dict):
-			element.setAttribute('ViurDataType', 'dict')
-			for key in data.keys():
-				childElement = recursiveSerializer(data[key], doc.createElement(key) )
-				element.appendChild( childElement )
-		elif isinstance(data, (tuple, list)):
-			element.setAttribute('ViurDataType', 'list')
-			for value in data:
-				childElement = recursiveSerializer(value, doc.createElement('entry') )
-				element.appendChild( childElement )
-		else:
-			if isinstance(data ,  bool):
-				element.setAttribute('ViurDataType', 'boolean')
-			elif isinstance( data, float ) or isinstance( data, int ):
-				element.setAttribute('ViurDataType', 'numeric')
-			elif isinstance( data, str ) or isinstance( data, unicode ):
-				element.setAttribute('ViurDataType', 'string')
-			elif isinstance( data, datetime ) or isinstance( data, date ) or isinstance( data, time ):
-				if isinstance( data, datetime ):
-					element.setAttribute('ViurDataType', 'datetime')
-				elif isinstance( data, date ):
-					element.setAttribute('ViurDataType', 'date')
-				else:
-					element.setAttribute('ViurDataType', 'time')
-				data = data.isoformat()
-			elif data is None:
-				element.setAttribute('ViurDataType', 'none')
-				data = ""
+from StringIO import StringIO
+from server import request, conf
+import codecs
+
+def _serializeXMLElement( doc, data, element ):
+	"""
+		Serializes *data* into *element*, using *doc* to create the child nodes.
+	"""
+	if isinstance(data, dict):
+		element.setAttribute('ViurDataType', 'dict')
+		for key in data.keys():
+			childElement = _serializeXMLElement(doc, data[key], doc.createElement(key) )
+			element.appendChild( childElement )
+	elif isinstance(data, (tuple, list)):
+		element.setAttribute('ViurDataType', 'list')
+		for value in data:
+			childElement = _serializeXMLElement(doc, value, doc.createElement('entry') )
+			element.appendChild( childElement )
+	else:
+		if isinstance(data ,  bool):
+			element.setAttribute('ViurDataType', 'boolean')
+		elif isinstance( data, float ) or isinstance( data, int ):
+			element.setAttribute('ViurDataType', 'numeric')
+		elif isinstance( data, str ) or isinstance( data, unicode ):
+			element.setAttribute('ViurDataType', 'string')
+		elif isinstance( data, datetime ) or isinstance( data, date ) or isinstance( data, time ):
+			if isinstance( data, datetime ):
+				element.setAttribute('ViurDataType', 'datetime')
+			elif isinstance( data, date ):
+				element.setAttribute('ViurDataType', 'date')
 			else:
-				raise NotImplementedError("Type %s is not supported!" % type(data))
-			element.appendChild( doc.createTextNode( unicode(data) ) )
-		return element
+				element.setAttribute('ViurDataType', 'time')
+			data = data.isoformat()
+		elif data is None:
+			element.setAttribute('ViurDataType', 'none')
+			data = ""
+		else:
+			raise NotImplementedError("Type %s is not supported!" % type(data))
+		element.appendChild( doc.createTextNode( unicode(data) ) )
+	return element
 
+def serializeXML( data ):
 	dom = minidom.getDOMImplementation()
 	doc = dom.createDocument(None, u"ViurResult", None)
 	elem = doc.childNodes[0]
-	return( recursiveSerializer( data, elem ).toprettyxml(encoding="UTF-8") )
+	return( _serializeXMLElement( doc, data, elem ).toprettyxml(encoding="UTF-8") )
+
+def streamXML( entries, data ):
+	"""
+		Like serializeXML( dict( skellist=entries, **data ) ), but serializes the
+		entries one by one, so they don't have to be kept in memory at once.
+
+		:param entries: Iterable of the values of the skellist element.
+		:param data: The other values of the result.
+		:type data: dict
+
+		:returns: Generator of the UTF-8 encoded chunks of the document.
+	"""
+	doc = minidom.getDOMImplementation().createDocument(None, u"ViurResult", None)
+	buf = StringIO()
+	writer = codecs.getwriter("UTF-8")( buf )
+
+	def flush():
+		res = buf.getvalue()
+		buf.seek( 0 )
+		buf.truncate()
+		return( res )
+
+	yield '<ViurResult ViurDataType="dict">\n'
+	hasEntries = False
+	for value in entries:
+		if not hasEntries:
+			hasEntries = True
+			yield '\t<skellist ViurDataType="list">\n'
+		_serializeXMLElement( doc, value, doc.createElement("entry") ).writexml( writer, "\t\t", "\t", "\n" )
+		yield flush()
+	if hasEntries:
+		yield '\t</skellist>\n'
+	else:
+		yield '\t<skellist ViurDataType="list"/>\n'
+	for key, value in data.items():
+		_serializeXMLElement( doc, value, doc.createElement(key) ).writexml( writer, "\t", "\t", "\n" )
+	yield flush()
+	yield '</ViurResult>\n'
 
 class DefaultRender( object ):
 
@@ -169,36 +214,57 @@ class DefaultRender( object ):
 		:return: A dict containing the rendered attributes.
 		:rtype: dict
 		"""
-		if isinstance(bone, dateBone):
-			if bone.value:
-				if bone.date and bone.time:
-					return bone.value.strftime("%d.%m.%Y %H:%M:%S")
-				elif bone.date:
-					return bone.value.strftime("%d.%m.%Y")
+		renderFunc = self.getBoneValueRenderer(bone)
+		if renderFunc is None:
+			return bone.value
+		return renderFunc(self, bone)
+
+	def getBoneValueRenderer(self, bone):
+		"""
+		Chooses the function rendering the value of *bone*.
 
-				return bone.value.strftime("%H:%M:%S")
+		:func:`renderSkelValues` remembers the result for each bone of a skeleton class,
+		so it can render the values of many entries without inspecting their bones again.
 
+		:param bone: The bone which value should be rendered.
+		:type bone: Any bone that inherits from :class:`server.bones.base.baseBone`.
+
+		:return: An unbound method of this render, taking (bone), or None if the value
+			is used as it is.
+		"""
+		if isinstance(bone, dateBone):
+			return type(self).renderDateBoneValue
 		elif isinstance(bone, relationalBone):
+			return type(self).renderRelationalBoneValue
+		return None
+
+	def renderDateBoneValue(self, bone):
+		if bone.value:
+			if bone.date and bone.time:
+				return bone.value.strftime("%d.%m.%Y %H:%M:%S")
+			elif bone.date:
+				return bone.value.strftime("%d.%m.%Y")
 
-			if isinstance(bone.value, list):
-				tmpList = []
+			return bone.value.strftime("%H:%M:%S")
+		return None
 
-				for k in bone.value:
-					tmpList.append({
-						"dest": self.renderSkelValues(k["dest"]),
-			            "rel": self.renderSkelValues(k.get("rel"))
-					})
+	def renderRelationalBoneValue(self, bone):
+		if isinstance(bone.value, list):
+			tmpList = []
 
-				return tmpList
+			for k in bone.value:
+				tmpList.append({
+					"dest": self.renderSkelValues(k["dest"]),
+		            "rel": self.renderSkelValues(k.get("rel"))
+				})
 
-			elif isinstance(bone.value, dict):
-				return {
-					"dest": self.renderSkelValues(bone.value["dest"]),
-				    "rel": self.renderSkelValues(bone.value.get("rel"))
-				}
-		else:
-			return bone.value
+			return tmpList
 
+		elif isinstance(bone.value, dict):
+			return {
+				"dest": self.renderSkelValues(bone.value["dest"]),
+			    "rel": self.renderSkelValues(bone.value.get("rel"))
+			}
 		return None
 
 	def renderSkelValues(self, skel):
@@ -217,8 +283,18 @@ class DefaultRender( object ):
 			return skel
 
 		res = {}
-		for key, bone in skel.items():
-			res[key] = self.renderBoneValue(bone)
+		renderCls = type(self)
+		if renderCls.renderBoneValue.im_func is not DefaultRender.renderBoneValue.im_func:
+			# renderBoneValue has been overridden, so it must be called for each bone
+			for key, bone in skel.items():
+				res[key] = self.renderBoneValue(bone)
+			return res
+
+		for key, bone, renderFunc in getBoneHandlers(skel, renderCls, self.getBoneValueRenderer):
+			if renderFunc is None:
+				res[key] = bone.value
+			else:
+				res[key] = renderFunc(self, bone)
 
 		return res
 
@@ -242,6 +318,15 @@ class DefaultRender( object ):
 		return self.renderEntry(skel, action, params)
 
 	def list(self, skellist, action="list", tpl=None, params=None, **kwargs):
+		if conf["viur.render.streamLists"] and not request.current.get().internalRequest:
+			return streamXML(
+				( self.renderSkelValues( skel ) for skel in skellist ),
+				{
+					"structure": self.renderSkelStructure( skellist[0] ) if len( skellist )>0 else None,
+					"action": action,
+					"params": params,
+					"cursor": skellist.cursor
+				} )
 		res = {}
 		skels = []
 
@@ -8,33 +8,78 @@
 
 	Its also possible to store data along with a securityKey and specify a lifeTime.
 
+	Keys bound to the session without any data are stateless: they're signed using the session's
+	security key and stored nowhere. Only their use is recorded in memcache, so they can't be
+	used twice. All other keys are stored in the datastore.
+
 """
 
 
 from datetime import datetime, timedelta
+from time import time
+from hashlib import sha256
+import hmac
 from server.utils import generateRandomString
 from server.session import current as currentSession
 from server import db, conf
 from server.tasks import PeriodicTask, callDeferred
+from google.appengine.api import memcache
 
 
 securityKeyKindName = "viur-securitykeys"
+__sessionKeyLifeTime__ = 30*60 # Keys bound to the session are valid for 30 Minutes
+__usedKeysNamespace__ = "viur-securitykeys-used" # Memcache namespace recording the stateless keys already used
+
+def _signSessionKey( nonce, until ):
+	"""
+		Computes the signature of a stateless key for the current session.
+	"""
+	secret = currentSession.getSessionSecurityKey()
+	msg = "%s.%s.%x" % ( currentSession.getSessionKey(), nonce, until )
+	return( hmac.new( str( secret ), msg, sha256 ).hexdigest()[ :32 ] )
+
+def _validateSessionKey( key ):
+	"""
+		Validates a stateless key created by :func:`create`.
+
+		:returns: True if the key is valid and hasn't been used before, False otherwise.
+	"""
+	try:
+		nonce, until, signature = str( key ).split(".") # Keys are plain ASCII, so this rejects any other (unicode) key
+		until = int( until, 16 )
+	except ValueError: # Including UnicodeEncodeError
+		return( False )
+	remaining = until - int( time() )
+	if remaining <= 0 or not currentSession.getSessionSecurityKey(): #This key has expired (or there's no session)
+		return( False )
+	if not hmac.compare_digest( str( signature ), _signSessionKey( nonce, until ) ):
+		return( False )
+	# Consume this key. If memcache is unavailable, we can't tell if it's been used before
+	return( memcache.add( nonce, True, time=remaining+1, namespace=__usedKeysNamespace__ ) )
 
 def create( duration=None, **kwargs ):
 	"""
 		Creates a new onetime Securitykey for the current session
-		If duration is not set, this key is valid only for the current session.
+		If duration is not set, this key is valid only for the current session (for 30 minutes).
 		Otherwise, the key and its data is serialized and saved inside the datastore
-		for up to duration-seconds
+		for up to duration-seconds.
+
+		Session-bound keys without data are signed instead of stored, so creating them
+		doesn't need any datastore write.
 
 		:param duration: Make this key valid for a fixed timeframe (and independend of the current session)
 		:type duration: Int or None
 		:returns: The new onetime key
 	"""
+	if duration is None and not kwargs:
+		currentSession.getSessionKey() # Ensure the session is initialized
+		nonce = generateRandomString()
+		until = int( time() ) + __sessionKeyLifeTime__
+		return( "%s.%x.%s" % ( nonce, until, _signSessionKey( nonce, until ) ) )
 	key = generateRandomString()
 	if duration is None:
 		sessionDependend = True
-		duration = 30*60 # 30 Mins from now
+		duration = __sessionKeyLifeTime__
 	else:
 		sessionDependend = False
 		duration = int( duration )
@@ -63,6 +108,8 @@ def validate( key, acceptSessionKey=False ):
 	if acceptSessionKey:
 		if key==currentSession.getSessionSecurityKey():
 			return( True )
+	if isinstance( key, basestring ) and "." in key: #A stateless key
+		return( _validateSessionKey( key ) )
 	try:
 		dbObj = db.Get( db.Key.from_path( securityKeyKindName, key ) )
 	except:
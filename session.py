@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 import threading
-import json, pickle
+import json, pickle, marshal
 import base64
 import string, random
 from time import time
 from server.tasks import PeriodicTask, callDeferred
 from server import db
 from server.config import conf
+from google.appengine.api import memcache
+from google.appengine.api.datastore_types import Blob
 from google.appengine.runtime.apiproxy_errors import CapabilityDisabledError, OverQuotaError
 import logging
 
@@ -25,18 +27,263 @@ import logging
 
 	A get-method is provided for convenience.
 	It returns None instead of raising an Exception if the key is not found.
+
+	Where sessions are stored is up to a :class:`SessionStore`; by default they're kept
+	in memcache and written through to the datastore (see :class:`MemcacheSessionStore`).
+	Set ``conf["viur.session.store"]`` to use another one.
 """
 
+__marshalFormat__ = "\x01" # Tag of sessions serialized by marshal (version 2)
+__pickleFormat__ = "\x02" # Tag of sessions containing values marshal can't serialize (ie. datetimes)
+
+def serializeSession( session ):
+	"""
+		Serializes the values of a session.
+
+		Sessions usually contain just a few strings, lists and dicts, which are written using
+		marshal; other sessions fall back to pickle. The first byte tags the format used.
+
+		:param session: The values of the session.
+		:type session: dict
+
+		:returns: The serialized session, or None for an empty session.
+		:rtype: google.appengine.api.datastore_types.Blob | None
+	"""
+	if not session:
+		return( None )
+	try:
+		return( Blob( __marshalFormat__ + marshal.dumps( session, 2 ) ) )
+	except ValueError: # Contains an object marshal doesn't support
+		return( Blob( __pickleFormat__ + pickle.dumps( session, protocol=pickle.HIGHEST_PROTOCOL ) ) )
+
+def unserializeSession( data ):
+	"""
+		Reverses :func:`serializeSession`.
+
+		Also reads sessions stored in the old format (base64 encoded pickles), which are
+		converted once they are saved again.
+
+		:returns: The values of the session.
+		:rtype: dict
+	"""
+	if not data:
+		return( {} )
+	if data[0] == __marshalFormat__:
+		return( marshal.loads( data[1:] ) )
+	elif data[0] == __pickleFormat__:
+		return( pickle.loads( data[1:] ) )
+	return( pickle.loads( base64.b64decode( data ) ) )
+
+
+class SessionStore( object ):
+	"""
+		Interface of the backends storing the sessions.
+
+		A session is passed as dictionary (called record) containing its serialized data (None
+		for empty sessions, see :func:`serializeSession`) and the properties "sslkey", "skey",
+		"keyIssued" (if "skey" has been handed out, ie. to sign security keys), "lastseen" and "user"
+		("guest" for sessions not associated with an user). Stores may add further
+		properties, which are passed back as part of the *oldRecord* to :meth:`put`.
+	"""
+
+	def get( self, key ):
+		"""
+			Fetches the session stored under *key*.
+
+			:returns: The record of that session, or None if there is no such session.
+			:rtype: dict | None
+		"""
+		raise NotImplementedError()
+
+	def put( self, key, record, oldRecord ):
+		"""
+			Stores the session *key*.
+
+			:param record: The current record of that session.
+			:type record: dict
+			:param oldRecord: The record returned by :meth:`get` for this request, if any.
+			:type oldRecord: dict | None
+		"""
+		raise NotImplementedError()
+
+	def delete( self, keys ):
+		"""
+			Removes the sessions stored under *keys*.
+
+			:type keys: list of str
+		"""
+		raise NotImplementedError()
+
+	def deleteByUser( self, user=None ):
+		"""
+			Removes all sessions of the given *user* ("guest" for sessions not associated
+			with an user), or **all** sessions if *user* is None.
+		"""
+		raise NotImplementedError()
+
+	def deleteExpired( self, timeStamp ):
+		"""
+			Removes all sessions which haven't been seen since *timeStamp*.
+		"""
+		raise NotImplementedError()
+
+
+class DatastoreSessionStore( SessionStore ):
+	"""
+		Stores each session as an entity of kind viur-session, which is written on each change.
+	"""
+	kindName = "viur-session"
+
+	def get( self, key ):
+		data = db.Get( db.Key.from_path( self.kindName, key ) )
+		if not data:
+			return( None )
+		return( dict( data ) )
+
+	def put( self, key, record, oldRecord ):
+		dbSession = db.Entity( self.kindName, name=key )
+		for k, v in record.items():
+			dbSession[ k ] = v
+		dbSession.set_unindexed_properties( ["data","sslkey","keyIssued" ] )
+		db.Put( dbSession )
+
+	def delete( self, keys ):
+		db.Delete( [ db.Key.from_path( self.kindName, key ) for key in keys ] )
+
+	def deleteByUser( self, user=None ):
+		query = db.Query( self.kindName )
+		if user is not None:
+			query.filter( "user =", str(user) )
+		keys = []
+		for key in query.iter(keysOnly=True):
+			keys.append( key.name() )
+			if len( keys ) >= 100:
+				self.delete( keys )
+				keys = []
+		if keys:
+			self.delete( keys )
+
+	def deleteExpired( self, timeStamp ):
+		doClearSessions( timeStamp, None )
+
+
+class MemcacheSessionStore( DatastoreSessionStore ):
+	"""
+		Keeps the sessions in memcache, using the datastore as backing store only.
+
+		A session is written through to the datastore if it's new, if its data, its user or its
+		keys have changed, or if the copy in the datastore is older than *writeInterval* seconds
+		(but at most half of ``conf["viur.session.lifeTime"]``, so active sessions aren't removed
+		as expired). Requests which just refresh the lastseen timestamp of a session (ie. every
+		request calling getSessionKey()) therefore only write to memcache.
+
+		Empty guest sessions are kept in memcache only (unless they have been written to the
+		datastore before), as losing them costs nothing. Once their security key has been handed
+		out, they are persisted as well, as losing that key invalidates all security keys signed
+		with it (ie. of forms rendered for that session).
+	"""
+	significantFields = ["data", "sslkey", "skey", "keyIssued", "user"]
+
+	def __init__( self, writeInterval=15*60, namespace="viur-session" ):
+		"""
+			:param writeInterval: Max. age in seconds of the datastore copy of an active session.
+			:type writeInterval: int
+			:param namespace: Memcache namespace to store the sessions in.
+			:type namespace: str
+		"""
+		super( MemcacheSessionStore, self ).__init__()
+		self.writeInterval = writeInterval
+		self.namespace = namespace
+
+	def get( self, key ):
+		try:
+			record = memcache.get( key, namespace=self.namespace )
+		except: # Memcache unavailable
+			record = None
+		if record is not None:
+			return( record )
+		record = super( MemcacheSessionStore, self ).get( key )
+		if record is not None:
+			record["persisted"] = record["lastseen"]
+		return( record )
+
+	def put( self, key, record, oldRecord ):
+		persisted = oldRecord.get( "persisted" ) if oldRecord else None
+		maxAge = min( self.writeInterval, conf[ "viur.session.lifeTime" ] / 2 )
+		if persisted is None and not record["data"] and record["user"] == "guest" and not record.get( "keyIssued" ):
+			pass # An empty guest session, there's nothing worth persisting
+		elif persisted is None or persisted < time() - maxAge \
+			or any( [ record.get( k ) != oldRecord.get( k ) for k in self.significantFields ] ):
+				super( MemcacheSessionStore, self ).put( key, record, oldRecord )
+				persisted = record["lastseen"]
+		cached = dict( record )
+		cached["persisted"] = persisted
+		try:
+			memcache.set( key, cached, time=conf[ "viur.session.lifeTime" ], namespace=self.namespace )
+		except: # Memcache unavailable; we'll read that session from the datastore again
+			pass
+
+	def delete( self, keys ):
+		memcache.delete_multi( keys, namespace=self.namespace )
+		super( MemcacheSessionStore, self ).delete( keys )
+
+
+class MemorySessionStore( SessionStore ):
+	"""
+		Keeps the sessions in memory of the current instance only.
+
+		Meant for unit tests, as sessions are neither persisted nor shared between instances.
+	"""
+
+	def __init__( self ):
+		super( MemorySessionStore, self ).__init__()
+		self.sessions = {}
+
+	def get( self, key ):
+		record = self.sessions.get( key )
+		if record is None:
+			return( None )
+		return( dict( record ) )
+
+	def put( self, key, record, oldRecord ):
+		self.sessions[ key ] = dict( record )
+
+	def delete( self, keys ):
+		for key in keys:
+			self.sessions.pop( key, None )
+
+	def deleteByUser( self, user=None ):
+		self.delete( [ k for k, v in self.sessions.items() if user is None or v["user"] == str(user) ] )
+
+	def deleteExpired( self, timeStamp ):
+		self.delete( [ k for k, v in self.sessions.items() if v["lastseen"] < timeStamp ] )
+
+
 class SessionWrapper( threading.local ):
 	cookieName = "viurCookie"
 
-	def __init__( self, sessionFactory, *args, **kwargs ):
+	def __init__( self, sessionFactory, store=None, *args, **kwargs ):
+		"""
+			:param sessionFactory: Class of the sessions.
+			:param store: Backend used unless conf["viur.session.store"] is set.
+			:type store: SessionStore
+		"""
 		super( SessionWrapper, self ).__init__( *args, **kwargs )
 		self.factory = sessionFactory
+		self.store = store
+
+	def getStore( self ):
+		"""
+			Returns the backend the sessions are stored in.
+
+			:rtype: SessionStore
+		"""
+		return( conf["viur.session.store"] or self.store )
 
 	def load( self, req ):
 		if not "session" in dir( self ):
 			self.session = self.factory()
+		self.session.store = self.getStore()
 		return( self.session.load( req ) )
 
 	def __contains__( self, key ):
@@ -129,6 +376,7 @@ class GaeSession:
 	plainCookieName = "viurHttpCookie"
 	sslCookieName = "viurSSLCookie"
 	kindName = "viur-session"
+	store = None # The SessionStore used, set by SessionWrapper
 
 	"""Store Sessions inside the Big Table/Memcache"""
 
@@ -144,11 +392,13 @@ class GaeSession:
 		self.key = None
 		self.sslKey = None
 		self.sessionSecurityKey = None
+		self.securityKeyIssued = False
 		self.session = {}
+		self.storedRecord = None
 		if self.plainCookieName in req.request.cookies:
 			cookie = req.request.cookies[ self.plainCookieName ]
 			try:
-				data = db.Get( db.Key.from_path( self.kindName, cookie ) )
+				data = self.store.get( str( cookie ) )
 			except:
 				return( False )
 			if data: #Loaded successfully from Memcache
@@ -156,10 +406,12 @@ class GaeSession:
 					# This session is too old
 					return( False )
 
-				self.session = pickle.loads( base64.b64decode(data["data"]) )
+				self.session = unserializeSession( data["data"] )
+				self.storedRecord = data
 				self.sslKey = data["sslkey"]
 				if "skey" in data:
 					self.sessionSecurityKey = data["skey"]
+					self.securityKeyIssued = bool( data.get( "keyIssued" ) )
 				else:
 					self.reset()
 				if data["lastseen"] < time()-5*60: #Refresh every 5 Minutes
@@ -179,7 +431,7 @@ class GaeSession:
 			Does nothing, if the session hasn't been changed in the current request.
 		"""
 		if self.changed:
-			serialized = base64.b64encode( pickle.dumps(self.session, protocol=pickle.HIGHEST_PROTOCOL ) )
+			serialized = serializeSession( self.session )
 			self.getSessionKey( req )
 			# Get the current user id
 			userid = None
@@ -188,15 +440,16 @@ class GaeSession:
 					userid = conf["viur.mainApp"].user.getCurrentUser()["key"]
 			except:
 				pass
+			record = {
+				"data": serialized,
+				"sslkey": self.sslKey,
+				"skey": self.sessionSecurityKey,
+				"keyIssued": self.securityKeyIssued,
+				"lastseen": time(),
+				"user": str(userid) if userid else "guest" #Store the userid inside the sessionobj, so we can kill specific sessions if needed
+			}
 			try:
-				dbSession = db.Entity( self.kindName, name=self.key )
-				dbSession["data"] = serialized
-				dbSession["sslkey"] = self.sslKey
-				dbSession["skey"] = self.sessionSecurityKey
-				dbSession["lastseen"] = time()
-				dbSession["user"] = str(userid) or "guest" #Store the userid inside the sessionobj, so we can kill specific sessions if needed
-				dbSession.set_unindexed_properties( ["data","sslkey" ] )
-				db.Put( dbSession )
+				self.store.put( self.key, record, self.storedRecord )
 			except (OverQuotaError, CapabilityDisabledError):
 				pass
 			req.response.headers.add_header( "Set-Cookie", bytes( "%s=%s; Max-Age=99999; Path=/; HttpOnly" % ( self.plainCookieName, self.key ) ) )
@@ -271,10 +524,12 @@ class GaeSession:
 		"""
 		lang = self.session.get("language")
 		if self.key:
-			db.Delete(db.Key.from_path(self.kindName, self.key))
+			self.store.delete( [ self.key ] )
 		self.key = None
+		self.storedRecord = None
 		self.sslKey = None
 		self.sessionSecurityKey = None
+		self.securityKeyIssued = False
 		self.changed = True
 		self.session = {}
 		if lang:
@@ -304,6 +559,9 @@ class GaeSession:
 			Returns the security key for this session.
 		"""
 		if self.sessionSecurityKey:
+			if not self.securityKeyIssued: # Keys signed with it must survive this session being evicted from memcache
+				self.securityKeyIssued = True
+				self.changed = True
 			return( self.sessionSecurityKey )
 		return( "" )
 
@@ -327,28 +585,27 @@ def killSessionByUser( user=None ):
 		:type user: str | None
 	"""
 	logging.error("Invalidating all sessions for %s" % user )
-	query = db.Query( GaeSession.kindName )
-	if user is not None:
-		query.filter( "user =", str(user) )
-	for key in query.iter(keysOnly=True):
-		db.Delete( key )
+	current.getStore().deleteByUser( user )
 
 @PeriodicTask(60*4)
 def startClearSessions():
 	"""
 		Removes old (expired) Sessions
 	"""
-	doClearSessions( time() - ( conf[ "viur.session.lifeTime" ] + 300 ), None )
+	current.getStore().deleteExpired( time() - ( conf[ "viur.session.lifeTime" ] + 300 ) )
 
 @callDeferred
 def doClearSessions( timeStamp, cursor ):
-	gotAtLeastOne = False
-	query = db.Query( GaeSession.kindName ).filter( "lastseen <", timeStamp )
-	for oldKey in query.run(100, keysOnly=True):
-		gotAtLeastOne = True
-		db.Delete( oldKey )
+	"""
+		Removes the sessions of a DatastoreSessionStore which haven't been seen since *timeStamp*.
+	"""
+	query = db.Query( DatastoreSessionStore.kindName ).filter( "lastseen <", timeStamp )
+	oldKeys = [ x.name() for x in query.run(100, keysOnly=True) ]
+	gotAtLeastOne = len( oldKeys ) > 0
+	if gotAtLeastOne:
+		current.getStore().delete( oldKeys )
 	newCursor = query.getCursor()
 	if gotAtLeastOne and newCursor and newCursor.urlsafe()!=cursor:
 		doClearSessions( timeStamp, newCursor.urlsafe() )
 
-current = SessionWrapper( GaeSession )
+current = SessionWrapper( GaeSession, MemcacheSessionStore() )
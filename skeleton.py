@@ -20,6 +20,8 @@ class BoneCounter(local):
 
 _boneCounter = BoneCounter()
 
+__boneHandlerVariants__ = 10 # Amount of different bone sets per skeleton class and owner cached by getBoneHandlers
+
 __undefindedC__ = object()
 
 class MetaBaseSkel(type):
@@ -43,6 +45,40 @@ class MetaBaseSkel(type):
 					                     (key, str(MetaBaseSkel.__reservedKeywords_)))
 		MetaBaseSkel._allSkelClasses.add(cls)
 		super(MetaBaseSkel, cls).__init__(name, bases, dct)
+		MetaBaseSkel._rebuildBoneMap(cls)
+
+	@staticmethod
+	def _rebuildBoneMap(cls):
+		"""
+			Precomputes the ordered mapping of bone names to bone instances for *cls*.
+
+			Skeleton instances copy their bones from this map, so they don't have to scan dir(cls)
+			and sort the bones each time a skeleton is created.
+		"""
+		bones = []
+		for key in dir(cls):
+			bone = getattr(cls, key)
+			if not "__" in key and isinstance(bone, baseBone):
+				bones.append((key, bone))
+		bones.sort(key=lambda x: x[1].idx)
+		type.__setattr__(cls, "__boneMap__", OrderedDict(bones))
+		type.__setattr__(cls, "__boneHandlers__", {})
+
+	def __setattr__(cls, key, value):
+		super(MetaBaseSkel, cls).__setattr__(key, value)
+		if isinstance(value, baseBone) or key in cls.__boneMap__:
+			# A bone has been added to (or removed from) this class after it has been created;
+			# this also affects all skeleton classes derived from it.
+			for skelCls in MetaBaseSkel._allSkelClasses:
+				if issubclass(skelCls, cls):
+					MetaBaseSkel._rebuildBoneMap(skelCls)
+
+	def __delattr__(cls, key):
+		super(MetaBaseSkel, cls).__delattr__(key)
+		if key in cls.__boneMap__:
+			for skelCls in MetaBaseSkel._allSkelClasses:
+				if issubclass(skelCls, cls):
+					MetaBaseSkel._rebuildBoneMap(skelCls)
 
 def skeletonByKind(kindName):
 	if not kindName:
@@ -58,6 +94,43 @@ def iterAllSkelClasses():
 	for cls in MetaBaseSkel._allSkelClasses:
 		yield cls
 
+def getBoneHandlers(skel, owner, getHandler):
+	"""
+		Returns a list of (key, bone, handler) for the bones of *skel*, where handler is getHandler(bone).
+
+		The lists are cached on the skeleton class (separately for each *owner*, usually a render
+		class), so a render doesn't have to inspect each bone again for each entry it renders.
+		As instances can have different bones than their class (sub-skeletons, RefSkels, bones
+		replaced on a cloned instance), a list is only reused for the exact same set of bones.
+
+		:param skel: The skeleton to build the list for.
+		:type skel: BaseSkeleton
+		:param owner: Hashable the handlers are cached for.
+		:param getHandler: Callable returning the handler for a given bone.
+		:type getHandler: callable
+
+		:returns: List of (key, bone, handler) tuples, which must not be modified.
+		:rtype: list
+	"""
+	dataDict = skel.__dataDict__
+	variants = type(skel).__boneHandlers__.setdefault(owner, [])
+	for bones, handlers in variants:
+		if dict.__eq__(bones, dataDict):
+			return handlers
+	handlers = [(key, bone, getHandler(bone)) for key, bone in dataDict.items()]
+	variants.append((dict(dataDict), handlers))
+	if len(variants) > __boneHandlerVariants__:
+		variants.pop(0)
+	return handlers
+
+# Attributes which are always resolved on the skeleton instance itself (instead of its bones)
+_skeletonAttributes = frozenset(["kindName","searchIndex","all","fromDB",
+				 "toDB", "items","keys","values","setValues","getValues","errors","fromClient",
+				 "preProcessBlobLocks","preProcessSerializedData","postSavedHandler",
+				 "postDeletedHandler", "delete","clone","getSearchDocumentFields","subSkels",
+				 "subSkel","refresh", "valuesCache", "getValuesCache", "setValuesCache",
+				 "isClonedInstance", "setBoneValue", "unserialize", "serialize", "ensureIsCloned"])
+
 
 class BaseSkeleton(object):
 	"""
@@ -79,43 +152,46 @@ class BaseSkeleton(object):
 		:vartype changedate: server.bones.dateBone
 	"""
 	__metaclass__ = MetaBaseSkel
+	__isInitialized_ = False # Set to True on the instance once __init__ has finished
 
 	def __setattr__(self, key, value):
-		if "_BaseSkeleton__isInitialized_" in dir(self):
+		if self.__isInitialized_:
 			if not key in ["valuesCache", "isClonedInstance"] and not self.isClonedInstance:
 				raise AttributeError("You cannot directly modify the skeleton instance. Grab a copy using .clone() first!")
-			if not "__dataDict__" in dir( self ):
+			if not "__dataDict__" in self.__dict__:
 				super(BaseSkeleton, self).__setattr__("__dataDict__", OrderedDict())
 			if not "__" in key and key != "isClonedInstance":
 				if isinstance(value , baseBone):
 					self.__dataDict__[key] = value
+					self.__sharedBones__.discard(key)
 					self.valuesCache[key] = value.getDefaultValue()
 				elif value is None and key in self.__dataDict__: #Allow setting a bone to None again
 					del self.__dataDict__[key]
+					self.__sharedBones__.discard(key)
 				elif key not in ["valuesCache"]:
 					raise ValueError("You tried to do what?")
 		super(BaseSkeleton, self).__setattr__(key, value)
 
 	def __delattr__(self, key):
-		if "_BaseSkeleton__isInitialized_" in dir(self) and not self.isClonedInstance:
+		if self.__isInitialized_ and not self.isClonedInstance:
 			raise AttributeError("You cannot directly modify the skeleton instance. Grab a copy using .clone() first!")
 		del self.__dataDict__[key]
+		self.__sharedBones__.discard(key)
 
 	def __getattribute__(self, item):
-		isOkay = False
-		if item.startswith("_") or item in ["kindName","searchIndex","all","fromDB",
-						    "toDB", "items","keys","values","setValues","getValues","errors","fromClient",
-						    "preProcessBlobLocks","preProcessSerializedData","postSavedHandler",
-						    "postDeletedHandler", "delete","clone","getSearchDocumentFields","subSkels",
-						    "subSkel","refresh", "valuesCache", "getValuesCache", "setValuesCache",
-						    "isClonedInstance", "setBoneValue", "unserialize", "serialize", "ensureIsCloned"]:
-			isOkay = True
-		elif not "_BaseSkeleton__isInitialized_" in dir(self):
-			isOkay = True
-		if isOkay:
-			return( super(BaseSkeleton, self).__getattribute__(item ))
-		elif item in self.__dataDict__:
-			return self.__dataDict__[item]
+		if item.startswith("_") or item in _skeletonAttributes \
+			or not object.__getattribute__(self, "_BaseSkeleton__isInitialized_"):
+				return object.__getattribute__(self, item)
+		dataDict = object.__getattribute__(self, "__dataDict__")
+		if item in dataDict:
+			sharedBones = object.__getattribute__(self, "__sharedBones__")
+			if item in sharedBones and object.__getattribute__(self, "isClonedInstance"):
+				# Copy-on-write: The caller might modify the bone we return, so it can't be shared anymore
+				bone = copy.deepcopy(dataDict[item])
+				bone.isClonedInstance = True
+				dataDict[item] = bone
+				sharedBones.discard(item)
+			return dataDict[item]
 		else:
 			raise AttributeError("Use [] to access your bones!")
 
@@ -202,30 +278,22 @@ class BaseSkeleton(object):
 		self.errors = {}
 		self.__dataDict__ = OrderedDict()
 		self.valuesCache = {}
+		# Bones are shared with the class (or the skeleton we've been cloned from) until they are
+		# accessed on a cloned instance (and therefore might get modified); see __getattribute__
 		if _cloneFrom:
-			for key, bone in _cloneFrom.__dataDict__.items():
-				self.__dataDict__[key] = copy.deepcopy(bone)
-				self.__dataDict__[key].isClonedInstance = True
+			self.__dataDict__.update(_cloneFrom.__dataDict__)
+			self.__sharedBones__ = set(self.__dataDict__.keys())
+			_cloneFrom.__sharedBones__.update(self.__sharedBones__) # These are now shared with us
 			self.valuesCache = copy.deepcopy(_cloneFrom.valuesCache)
 			self.isClonedInstance = True
 			self.errors = copy.deepcopy(_cloneFrom.errors)
 		else:
-			tmpList = []
-			for key in dir(self):
-				bone = getattr(self, key)
-				if not "__" in key and isinstance(bone , baseBone):
-					tmpList.append((key, bone))
-			tmpList.sort(key=lambda x: x[1].idx)
-			#logging.error(tmpList)
-			for key, bone in tmpList:
-				if cloned:
-					self.__dataDict__[key] = copy.deepcopy(bone)
-					self.__dataDict__[key].isClonedInstance = True
-				else:
-					self.__dataDict__[key] = bone
+			for key, bone in type(self).__boneMap__.items():
+				self.__dataDict__[key] = bone
 				self.valuesCache[key] = bone.getDefaultValue()
+			self.__sharedBones__ = set(self.__dataDict__.keys())
 			self.isClonedInstance = cloned
-		if "enforceUniqueValuesFor" in dir(self) and self.enforceUniqueValuesFor is not None:
+		if getattr(self, "enforceUniqueValuesFor", None) is not None:
 			raise NotImplementedError("enforceUniqueValuesFor is not supported anymore. Set unique=True on your bone.")
 		self.__isInitialized_ = True
 
@@ -238,16 +306,17 @@ class BaseSkeleton(object):
 
 	@classmethod
 	def setSystemInitialized(cls):
-		for attrName in dir(cls):
-			bone = getattr(cls, attrName)
-			if isinstance(bone, baseBone):
-				bone.setSystemInitialized()
+		for bone in cls.__boneMap__.values():
+			bone.setSystemInitialized()
 
 
 	def clone(self):
 		"""
 			Creates a stand-alone copy of the current Skeleton object.
 
+			Bones are copied lazily, once they are accessed as attribute (skel.boneName) on either
+			skeleton. Bones returned by items() and values() are still shared and must not be modified.
+
 			:returns: The stand-alone copy of the object.
 			:rtype: Skeleton
 		"""
@@ -421,11 +490,11 @@ class BaseSkeleton(object):
 			This function causes a refresh of all relational bones and their associated
 			information.
 		"""
+		prefetchReferencedEntities([self])
 		for key,bone in self.items():
 			if not isinstance( bone, baseBone ):
 				continue
-			if "refresh" in dir( bone ):
-				bone.refresh( self.valuesCache, key, self )
+			bone.refresh( self.valuesCache, key, self )
 
 
 class MetaSkel(MetaBaseSkel):
@@ -564,30 +633,47 @@ class Skeleton(BaseSkeleton):
 		def txnUpdate(key, mergeFrom, clearUpdateTag):
 			blobList = set()
 			skel = type(mergeFrom)()
+			uniqueBones = [boneName for boneName, boneInstance in skel.items() if boneInstance.unique]
+
+			def uniqueLockKey(boneName, value):
+				return db.Key.from_path("%s_%s_uniquePropertyIndex" % (skel.kindName, boneName), value)
+
+			# Hashes for bones that must have an unique value
+			newUniqeValues = {}
+			for boneName in uniqueBones:
+				newUniqeValues[boneName] = getattr(skel, boneName).getUniquePropertyIndexValue(
+					self.valuesCache, boneName)
+
+			# Fetch everything we need (the current entity, its blob-lock object and the locks
+			# of our new unique values) within one batch
+			readKeys = [uniqueLockKey(boneName, value) for boneName, value in newUniqeValues.items() if value is not None]
+			if key:
+				k = db.Key(key)
+				assert k.kind() == skel.kindName, "Cannot write to invalid kind!"
+				readKeys += [k, db.Key.from_path("viur-blob-locks", str(k))]
+			readRes = {}
+			if readKeys:
+				for entity in db.Get(readKeys):
+					if entity is not None:
+						readRes[str(entity.key())] = entity
+
 			# Load the current values from Datastore or create a new, empty db.Entity
 			if not key:
 				dbObj = db.Entity(skel.kindName)
 				oldBlobLockObj = None
 			else:
-				k = db.Key(key)
-				assert k.kind() == skel.kindName, "Cannot write to invalid kind!"
-				try:
-					dbObj = db.Get(k)
-				except db.EntityNotFoundError:
-					dbObj = db.Entity(k.kind(), id=k.id(), name=k.name(), parent=k.parent())
-				else:
+				if str(k) in readRes:
+					dbObj = readRes[str(k)]
 					skel.setValues(dbObj)
-				try:
-					oldBlobLockObj = db.Get(db.Key.from_path("viur-blob-locks", str(k)))
-				except:
-					oldBlobLockObj = None
+				else:
+					dbObj = db.Entity(k.kind(), id=k.id(), name=k.name(), parent=k.parent())
+				oldBlobLockObj = readRes.get(str(db.Key.from_path("viur-blob-locks", str(k))))
 
 			# Remember old hashes for bones that must have an unique value
 			oldUniqeValues = {}
-			for boneName, boneInstance in skel.items():
-				if boneInstance.unique:
-					if "%s.uniqueIndexValue" % boneName in dbObj:
-						oldUniqeValues[boneName] = dbObj["%s.uniqueIndexValue" % boneName]
+			for boneName in uniqueBones:
+				if "%s.uniqueIndexValue" % boneName in dbObj:
+					oldUniqeValues[boneName] = dbObj["%s.uniqueIndexValue" % boneName]
 
 			## Merge the values from mergeFrom in
 			for key, bone in skel.items():
@@ -608,31 +694,19 @@ class Skeleton(BaseSkeleton):
 			except:  # Its not an update but an insert, no key yet
 				ourKey = None
 			# Lock hashes from bones that must have unique values
-			newUniqeValues = {}
-			for boneName, boneInstance in skel.items():
-				if boneInstance.unique:
+			for boneName in uniqueBones:
+				if newUniqeValues[boneName] is not None:
 					# Check if the property is really unique
-					newUniqeValues[boneName] = boneInstance.getUniquePropertyIndexValue(
-						self.valuesCache, boneName)
-					if newUniqeValues[boneName] is not None:
-						try:
-							lockObj = db.Get(db.Key.from_path(
-								"%s_%s_uniquePropertyIndex" % (skel.kindName, boneName),
-								newUniqeValues[boneName]))
-
-							if lockObj["references"] != ourKey:
-								# This value has been claimed, and that not by us
-
-								raise ValueError(
-									"The unique value '%s' of bone '%s' has been recently claimed!" %
-										(self.valuesCache[boneName], boneName))
-
-						except db.EntityNotFoundError:  # No lockObj found for that value, we can use that
-							pass
-						dbObj["%s.uniqueIndexValue" % boneName] = newUniqeValues[boneName]
-					else:
-						if "%s.uniqueIndexValue" % boneName in dbObj:
-							del dbObj["%s.uniqueIndexValue" % boneName]
+					lockObj = readRes.get(str(uniqueLockKey(boneName, newUniqeValues[boneName])))
+					if lockObj is not None and lockObj["references"] != ourKey:
+						# This value has been claimed, and that not by us
+						raise ValueError(
+							"The unique value '%s' of bone '%s' has been recently claimed!" %
+								(self.valuesCache[boneName], boneName))
+					dbObj["%s.uniqueIndexValue" % boneName] = newUniqeValues[boneName]
+				else:
+					if "%s.uniqueIndexValue" % boneName in dbObj:
+						del dbObj["%s.uniqueIndexValue" % boneName]
 			if not skel.searchIndex:
 				# We generate the searchindex using the full skel, not this (maybe incomplete one)
 				tags = []
@@ -641,14 +715,22 @@ class Skeleton(BaseSkeleton):
 						tags += [tag for tag in _bone.getSearchTags(self.valuesCache, key) if
 						         (tag not in tags and len(tag) < 400)]
 				dbObj["viur_tags"] = tags
-			db.Put(dbObj)  # Write the core entry back
-			# Now write the blob-lock object
 			blobList = skel.preProcessBlobLocks(blobList)
 			if blobList is None:
 				raise ValueError(
 					"Did you forget to return the bloblist somewhere inside getReferencedBlobs()?")
 			if None in blobList:
 				raise ValueError("None is not a valid blobKey.")
+
+			# Collect all writes, so they're sent in one batch
+			toPut = []
+			toDelete = []
+			if ourKey is None:
+				# Inserts have to be written first, as we need their key for the lock objects
+				db.Put(dbObj)
+			else:
+				toPut.append(dbObj)  # Write the core entry back
+			# Now write the blob-lock object
 			if oldBlobLockObj is not None:
 				oldBlobs = set(oldBlobLockObj["active_blob_references"] if oldBlobLockObj[
 					                                                           "active_blob_references"] is not None else [])
@@ -663,46 +745,49 @@ class Skeleton(BaseSkeleton):
 					                                            "old_blob_references"] is not None and len(
 					oldBlobLockObj["old_blob_references"]) > 0
 				oldBlobLockObj["is_stale"] = False
-				db.Put(oldBlobLockObj)
+				toPut.append(oldBlobLockObj)
 			else:  # We need to create a new blob-lock-object
 				blobLockObj = db.Entity("viur-blob-locks", name=str(dbObj.key()))
 				blobLockObj["active_blob_references"] = list(blobList)
 				blobLockObj["old_blob_references"] = []
 				blobLockObj["has_old_blob_references"] = False
 				blobLockObj["is_stale"] = False
-				db.Put(blobLockObj)
-			for boneName, boneInstance in skel.items():
-				if boneInstance.unique:
-					# Update/create/delete missing lock-objects
-					if boneName in oldUniqeValues and oldUniqeValues[boneName] != \
-						newUniqeValues[boneName]:
-						# We had an old lock and its value changed
-						try:
-							# Try to delete the old lock
-							oldLockObj = db.Get(db.Key.from_path(
-								"%s_%s_uniquePropertyIndex" % (skel.kindName, boneName),
-								oldUniqeValues[boneName]))
-							if oldLockObj["references"] != ourKey:
-								# We've been supposed to have that lock - but we don't.
-								# Don't remove that lock as it now belongs to a different entry
-								logging.critical(
-									"Detected Database corruption! A Value-Lock had been reassigned!")
-							else:
-								# It's our lock which we don't need anymore
-								db.Delete(db.Key.from_path(
-									"%s_%s_uniquePropertyIndex" % (
-									skel.kindName, boneName),
-									oldUniqeValues[boneName]))
-						except db.EntityNotFoundError as e:
-							logging.critical(
-								"Detected Database corruption! Could not delete stale lock-object!")
-					if newUniqeValues[boneName] is not None:
-						# Lock the new value
-						newLockObj = db.Entity(
-							"%s_%s_uniquePropertyIndex" % (skel.kindName, boneName),
-							name=newUniqeValues[boneName])
-						newLockObj["references"] = str(dbObj.key())
-						db.Put(newLockObj)
+				toPut.append(blobLockObj)
+			# Fetch the locks of our old unique values which have changed (if any) in one batch
+			changedUniqueBones = [boneName for boneName in uniqueBones if boneName in oldUniqeValues
+			                        and oldUniqeValues[boneName] != newUniqeValues[boneName]]
+			oldLockObjs = {}
+			if changedUniqueBones:
+				for oldLockObj in db.Get([uniqueLockKey(boneName, oldUniqeValues[boneName]) for boneName in changedUniqueBones]):
+					if oldLockObj is not None:
+						oldLockObjs[str(oldLockObj.key())] = oldLockObj
+			for boneName in uniqueBones:
+				# Update/create/delete missing lock-objects
+				if boneName in changedUniqueBones:
+					# We had an old lock and its value changed
+					oldLockKey = uniqueLockKey(boneName, oldUniqeValues[boneName])
+					oldLockObj = oldLockObjs.get(str(oldLockKey))
+					if oldLockObj is None:
+						logging.critical(
+							"Detected Database corruption! Could not delete stale lock-object!")
+					elif oldLockObj["references"] != ourKey:
+						# We've been supposed to have that lock - but we don't.
+						# Don't remove that lock as it now belongs to a different entry
+						logging.critical(
+							"Detected Database corruption! A Value-Lock had been reassigned!")
+					else:
+						# It's our lock which we don't need anymore
+						toDelete.append(oldLockKey)
+				if newUniqeValues[boneName] is not None:
+					# Lock the new value
+					newLockObj = db.Entity(
+						"%s_%s_uniquePropertyIndex" % (skel.kindName, boneName),
+						name=newUniqeValues[boneName])
+					newLockObj["references"] = str(dbObj.key())
+					toPut.append(newLockObj)
+			db.Put(toPut)
+			if toDelete:
+				db.Delete(toDelete)
 			return (str(dbObj.key()), dbObj, skel)
 
 		# END of txnUpdate subfunction
@@ -943,15 +1028,16 @@ class RefSkel(RelSkel):
 			:rtype: RefSkel
 		"""
 		skel = cls(cloned=True)
-		# Remove the __isInitialized_ marker sothat we can write directly to __dataDict__ (which is a
-		# safe operation in this case as RelSkels must not be subclassed and therefore cannot contain
-		# class-level bones
-		#super(BaseSkeleton, skel).__delattr__("_BaseSkeleton__isInitialized_")
+		if isinstance(skelCls, BaseSkeleton):
+			bones = skelCls.__dataDict__
+		else:
+			bones = skelCls.__boneMap__
 		for key in args:
-			if key in dir(skelCls):
-				setattr(skel, key, getattr(skelCls, key))
+			if key in bones:
+				# The bones are shared with skelCls; they get copied if they're accessed on skel
+				setattr(skel, key, bones[key])
+				skel.__sharedBones__.add(key)
 				skel[key] = None
-		#super(BaseSkeleton, skel).__setattr__("_BaseSkeleton__isInitialized_", True)
 		return skel
 
 class SkelList( list ):
@@ -984,31 +1070,124 @@ class SkelList( list ):
 		self.baseSkel.setValuesCache(item)
 		return self.baseSkel
 
+def prefetchReferencedEntities(skels):
+	"""
+		Fetches the entities referenced by the relationalBones of all *skels* with one batched Get.
+
+		These entities are kept in the per-request cache of :mod:`server.db`, so refreshing these skeletons
+		afterwards doesn't cost another datastore round trip for each reference.
+		Does nothing if caching is disabled (see viur.db.caching).
+
+		:param skels: The skeletons which are about to be refreshed.
+		:type skels: list of BaseSkeleton
+	"""
+	if not conf["viur.db.caching"]:
+		return
+	keys = set()
+	for skel in skels:
+		for boneName, bone in skel.items():
+			if isinstance(bone, relationalBone):
+				keys.update(bone.getReferencedKeys(skel.valuesCache, boneName))
+	if keys:
+		db.Get(list(keys))
+
 ### Tasks ###
 
+__relationUpdateBatchSize__ = 100 # Amount of viur-relations entries processed by one updateRelationsShard task
+__relationUpdateShardsPerTask__ = 50 # Amount of updateRelationsShard tasks started by one updateRelations task
+
+def _relationUpdateQuery( destID, minChangeTime ):
+	return( db.Query( "viur-relations" ).filter("dest.key =", destID ).filter("viur_delayed_update_tag <",minChangeTime) )
+
 @callDeferred
 def updateRelations( destID, minChangeTime, cursor=None ):
+	"""
+		Propagates the changes of the entity *destID* to all entities referencing it.
+
+		This only scans the keys of the viur-relations entries pointing to destID and splits
+		them into ranges of __relationUpdateBatchSize__ entries, which are processed in parallel
+		by :func:`updateRelationsShard`. If there are too many of them to be scanned in one task,
+		it calls itself again with the cursor where it stopped.
+	"""
 	logging.debug("Starting updateRelations for %s ; minChangeTime %s", destID, minChangeTime)
-	updateListQuery = db.Query( "viur-relations" ).filter("dest.key =", destID ).filter("viur_delayed_update_tag <",minChangeTime)
-	if cursor:
-		updateListQuery.cursor( cursor )
-	updateList = updateListQuery.run(limit=5)
+	for i in range( 0, __relationUpdateShardsPerTask__ ):
+		updateListQuery = _relationUpdateQuery( destID, minChangeTime )
+		if cursor:
+			updateListQuery.cursor( cursor )
+		updateList = updateListQuery.run( limit=__relationUpdateBatchSize__, keysOnly=True )
+		if not updateList:
+			return
+		endCursor = updateListQuery.getCursor().urlsafe()
+		updateRelationsShard( destID, minChangeTime, cursor, endCursor )
+		if len( updateList ) < __relationUpdateBatchSize__:
+			return
+		cursor = endCursor
+	updateRelations( destID, minChangeTime, cursor )
+
+@callDeferred
+def updateRelationsShard( destID, minChangeTime, cursor, endCursor ):
+	"""
+		Updates the viur-relations entries between *cursor* and *endCursor* that point to *destID*.
 
+		The entity destID is fetched only once. Entities referencing it are rewritten only if one of the
+		values they've copied from destID actually changed (which also rewrites their viur-relations
+		entries); otherwise only the dest.* properties of outdated viur-relations entries are patched.
+	"""
+	try:
+		destEntity = db.Get( destID )
+	except db.EntityNotFoundError:
+		logging.info("%s has been deleted, not updating the entries referencing it" % destID)
+		return
+	updateListQuery = _relationUpdateQuery( destID, minChangeTime ).cursor( cursor, endCursor )
+	updateList = updateListQuery.run( limit=__relationUpdateBatchSize__ )
+
+	# Group these entries by the entity they belong to, and fetch these entities at once
+	relationsBySrc = OrderedDict()
 	for srcRel in updateList:
+		relationsBySrc.setdefault( str( srcRel.key().parent() ), [] ).append( srcRel )
+	srcEntities = { str( x.key() ): x for x in db.Get( [ db.Key( x ) for x in relationsBySrc.keys() ] ) if x }
+
+	destValues = {} # Cache of the dest.* values for each relationalBone
+	toPut = []
+	for srcKey, srcRels in relationsBySrc.items():
 		try:
-			skel = skeletonByKind(srcRel["viur_src_kind"])()
+			skelCls = skeletonByKind( srcRels[0]["viur_src_kind"] )
 		except AssertionError:
-			logging.info("Deleting %s which refers to unknown kind %s" % (str(srcRel.key()), srcRel["viur_src_kind"]))
+			logging.info("Deleting %s which refers to unknown kind %s" % (str(srcRels[0].key()), srcRels[0]["viur_src_kind"]))
 			continue
-
-		if not skel.fromDB( str(srcRel.key().parent()) ):
-			logging.warning("Cannot update stale reference to %s (referenced from %s)" % (str(srcRel.key().parent()), str(srcRel.key())))
+		if not srcKey in srcEntities:
+			logging.warning("Cannot update stale reference to %s (referenced from %s)" % (srcKey, str(srcRels[0].key())))
+			continue
+		skel = skelCls()
+		skel.setValues( srcEntities[ srcKey ] )
+		skel["key"] = srcKey
+		changed = False
+		for boneName in set( x["viur_src_property"] for x in srcRels ):
+			bone = skelCls.__boneMap__.get( boneName )
+			if isinstance( bone, relationalBone ) and bone.updateReferencedValues( skel.valuesCache, boneName, destEntity ):
+				changed = True
+		if changed:
+			skel.toDB( clearUpdateTag=True ) # This also rewrites its viur-relations entries
 			continue
-		for key,_bone in skel.items():
-			_bone.refresh(skel.valuesCache, key, skel)
-		skel.toDB( clearUpdateTag=True )
-	if len(updateList)==5:
-		updateRelations( destID, minChangeTime, updateListQuery.getCursor().urlsafe() )
+		for srcRel in srcRels:
+			bone = skelCls.__boneMap__.get( srcRel["viur_src_property"] )
+			if not isinstance( bone, relationalBone ) or not bone.indexed:
+				continue
+			if not bone in destValues:
+				valDict = { "key": str( destEntity.key() ) }
+				bone._updateDestValues( valDict, destEntity )
+				bone._refSkelCache.setValuesCache( valDict )
+				destValues[ bone ] = bone._refSkelCache.serialize()
+			outdated = False
+			for k, v in destValues[ bone ].items():
+				if k != "key" and srcRel.get( "dest."+k ) != v:
+					srcRel[ "dest."+k ] = v
+					outdated = True
+			if outdated:
+				srcRel[ "viur_delayed_update_tag" ] = time()
+				toPut.append( db.Entity.FromDatastoreEntity( srcRel ) ) # Without query caching, run() returns datastore.Entity objects
+	if toPut:
+		db.Put( toPut )
 
 
 @CallableTask
@@ -1066,12 +1245,21 @@ def processChunk(module, compact, cursor, allCount=0, notify=None):
 		logging.error("TaskUpdateSearchIndex: Invalid module")
 		return
 	query = Skel().all().cursor( cursor )
-	count = 0
-	for key in query.run(25, keysOnly=True):
-		count += 1
+	keys = query.run(25, keysOnly=True)
+	count = len(keys)
+	# Fetch the entities of this chunk and everything they reference at once
+	skels = []
+	for entity in (db.Get(list(keys)) if keys else []):
+		if not entity:
+			continue
+		skel = Skel()
+		skel.setValues(entity)
+		skel["key"] = str(entity.key())
+		skels.append(skel)
+	prefetchReferencedEntities(skels)
+	for skel in skels:
+		key = skel["key"]
 		try:
-			skel = Skel()
-			skel.fromDB(str(key))
 			if compact=="YES":
 				raise NotImplementedError() #FIXME: This deletes the __currentKey__ property..
 				skel.delete()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for server.bones, see :mod:`server.tests.test_db` on how to run them.
+"""
+import unittest
+from google.appengine.ext import testbed
+from server.skeleton import Skeleton
+from server.bones import stringBone, relationalBone
+
+
+class RelationTestDestSkel( Skeleton ):
+	kindName = "viur-test-dest"
+	name = stringBone( descr="name", indexed=True )
+
+
+class RelationTestSrcSkel( Skeleton ):
+	kindName = "viur-test-src"
+	name = stringBone( descr="name" )
+	ref = relationalBone( kind="viur-test-dest", module="viur-test-dest", indexed=True )
+
+
+class RelationalBoneTest( unittest.TestCase ):
+	"""
+		Saving a skeleton keeps the viur-relations entries of its relationalBones in sync.
+	"""
+
+	def setUp( self ):
+		self.testbed = testbed.Testbed()
+		self.testbed.activate()
+		self.testbed.init_datastore_v3_stub()
+		self.testbed.init_memcache_stub()
+		self.testbed.init_taskqueue_stub()
+		self.testbed.init_search_stub()
+		RelationTestDestSkel.setSystemInitialized()
+		RelationTestSrcSkel.setSystemInitialized()
+
+	def tearDown( self ):
+		self.testbed.deactivate()
+
+	def _getRelations( self ):
+		from server import db
+		return( list( db.Query( "viur-relations" ).filter( "viur_src_kind =", "viur-test-src" ).run( 10 ) ) )
+
+	def testResaveExistingRelation( self ):
+		destSkel = RelationTestDestSkel()
+		destSkel[ "name" ] = u"dest"
+		destKey = destSkel.toDB()
+		srcSkel = RelationTestSrcSkel()
+		srcSkel[ "name" ] = u"src"
+		srcSkel[ "ref" ] = { "dest": { "key": destKey, "name": u"dest" }, "rel": None }
+		srcKey = srcSkel.toDB()
+		self.assertEqual( len( self._getRelations() ), 1 )
+		srcSkel = RelationTestSrcSkel()
+		self.assertTrue( srcSkel.fromDB( srcKey ) )
+		srcSkel[ "name" ] = u"renamed"
+		srcSkel.toDB() # Updates the existing viur-relations entry
+		relations = self._getRelations()
+		self.assertEqual( len( relations ), 1 )
+		self.assertEqual( relations[0][ "src.name" ], u"renamed" )
+		self.assertEqual( relations[0][ "dest.key" ], destKey )
+
+	def testRepeatedKeyFromClient( self ):
+		destSkel = RelationTestDestSkel()
+		destSkel[ "name" ] = u"dest"
+		destKey = str( destSkel.toDB() )
+		bone = RelationTestSrcSkel.ref
+		valuesCache = {}
+		self.assertEqual( bone.fromClient( valuesCache, "ref", { "ref": destKey } ), None )
+		self.assertEqual( valuesCache[ "ref" ][ "dest" ][ "key" ], destKey )
+		# A repeated parameter is passed as list
+		self.assertEqual( bone.fromClient( {}, "ref", { "ref": [ destKey, destKey ] } ), "Invalid entry selected" )
+
+	def testUpdateOutdatedRelationWithoutQueryCache( self ):
+		from server import db, tasks
+		from server.config import conf
+		destSkel = RelationTestDestSkel()
+		destSkel[ "name" ] = u"dest"
+		destKey = destSkel.toDB()
+		srcSkel = RelationTestSrcSkel()
+		srcSkel[ "name" ] = u"src"
+		srcSkel[ "ref" ] = { "dest": { "key": destKey, "name": u"dest" }, "rel": None }
+		srcSkel.toDB()
+		relation = db.Entity.FromDatastoreEntity( self._getRelations()[0] )
+		relation[ "dest.name" ] = u"outdated"
+		db.Put( relation )
+		updateRelationsShard = tasks._deferedTasks[ "updateRelationsShard.server.skeleton" ]
+		oldCaching = conf[ "viur.db.caching" ]
+		conf[ "viur.db.caching" ] = 1
+		try:
+			updateRelationsShard( destKey, relation[ "viur_delayed_update_tag" ]+1, None, None )
+		finally:
+			conf[ "viur.db.caching" ] = oldCaching
+		self.assertEqual( self._getRelations()[0][ "dest.name" ], u"dest" )
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for server.db, run them from your project's directory (so *server* is importable)
+	with the App Engine SDK on your path.
+
+	Importing *server* already reads from memcache (see :class:`server.config.SharedConf`),
+	so the datastore and memcache stubs have to be registered before these tests are loaded,
+	ie. by activating a :class:`google.appengine.ext.testbed.Testbed` in the script running
+	``unittest.defaultTestLoader.discover( "server/tests", top_level_dir="." )``.
+"""
+import unittest
+from google.appengine.ext import testbed
+
+
+class DatastoreTestCase( unittest.TestCase ):
+	"""
+		Runs each test against empty datastore and memcache stubs.
+	"""
+
+	def setUp( self ):
+		self.testbed = testbed.Testbed()
+		self.testbed.activate()
+		self.testbed.init_datastore_v3_stub()
+		self.testbed.init_memcache_stub()
+
+	def tearDown( self ):
+		self.testbed.deactivate()
+
+	def _putEntities( self, kind, names ):
+		from server import db
+		keys = []
+		for name in names:
+			entity = db.Entity( kind )
+			entity[ "name" ] = name
+			keys.append( db.Put( entity ) )
+		return( keys )
+
+
+class KeyLookupTest( DatastoreTestCase ):
+	"""
+		Queries filtering by nothing but a list of keys are run as one batched Get.
+	"""
+
+	def testKeyInFilter( self ):
+		from server import db
+		keys = self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		res = db.Query( "viur-test" ).filter( "%s IN" % db.KEY_SPECIAL_PROPERTY, keys ).run( 10 )
+		self.assertEqual( sorted( x.key() for x in res ), sorted( keys ) )
+
+	def testKeyInFilterSkipsOtherKindsAndDuplicates( self ):
+		from server import db
+		keys = self._putEntities( "viur-test", [ "a", "b" ] )
+		otherKeys = self._putEntities( "viur-test-other", [ "c" ] )
+		res = db.Query( "viur-test" ).filter( "%s IN" % db.KEY_SPECIAL_PROPERTY, keys + keys[ :1 ] + otherKeys ).run( 10 )
+		self.assertEqual( sorted( x.key() for x in res ), sorted( keys ) )
+
+	def testKeyInFilterOrdering( self ):
+		from server import db
+		keys = self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		query = db.Query( "viur-test" ).filter( "%s IN" % db.KEY_SPECIAL_PROPERTY, keys ).order( ( "name", db.DESCENDING ) )
+		self.assertEqual( [ x[ "name" ] for x in query.run( 2 ) ], [ "c", "b" ] )
+
+	def testKeyInFilterOrderedBefore( self ):
+		from server import db
+		keys = self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		query = db.Query( "viur-test" ).order( ( "name", db.DESCENDING ) ).filter( "%s IN" % db.KEY_SPECIAL_PROPERTY, keys )
+		self.assertEqual( [ x[ "name" ] for x in query.run( 10 ) ], [ "c", "b", "a" ] )
+
+	def testKeyInFilterWithoutLimit( self ):
+		from server import db
+		keys = self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		query = db.Query( "viur-test" ).filter( "%s IN" % db.KEY_SPECIAL_PROPERTY, keys ).order( "name" )
+		self.assertEqual( [ x[ "name" ] for x in query.run( 0 ) ], [ "a", "b", "c" ] )
+
+	def testInFilterOrdering( self ):
+		from server import db
+		self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		query = db.Query( "viur-test" ).filter( "name IN", [ "a", "c" ] ).order( ( "name", db.DESCENDING ) )
+		self.assertEqual( [ x[ "name" ] for x in query.run( 10 ) ], [ "c", "a" ] )
+
+
+
+class MultiQueryCursorTest( DatastoreTestCase ):
+	"""
+		Queries merging several sub-queries can be paged using a :class:`server.db.MultiQueryCursor`.
+	"""
+
+	def _fetchPages( self, buildQuery, pageSize ):
+		pages = []
+		cursor = None
+		while len( pages ) < 10:
+			query = buildQuery()
+			if cursor:
+				query.cursor( cursor )
+			pages.append( [ x[ "name" ] for x in query.run( pageSize ) ] )
+			cursor = query.getCursor()
+			if not cursor:
+				break
+			cursor = cursor.urlsafe()
+		return( pages )
+
+	def testInFilterPaging( self ):
+		from server import db
+		self._putEntities( "viur-test", [ "e", "b", "f", "a", "d", "c" ] )
+		pages = self._fetchPages( lambda: db.Query( "viur-test" ).filter( "name IN", [ "a", "c", "d", "f" ] ).order( "name" ), 3 )
+		self.assertEqual( pages, [ [ "a", "c", "d" ], [ "f" ] ] )
+
+	def testNotEqualFilterPaging( self ):
+		from server import db
+		# Inserted out of order, so sorting by key differs from sorting by name
+		self._putEntities( "viur-test", [ "e", "b", "f", "a", "d", "c" ] )
+		pages = self._fetchPages( lambda: db.Query( "viur-test" ).filter( "name !=", "c" ), 2 )
+		self.assertEqual( pages, [ [ "a", "b" ], [ "d", "e" ], [ "f" ] ] )
+
+	def testInFilterKeysOnlyWithoutQueryCache( self ):
+		from server import db
+		from server.config import conf
+		keys = self._putEntities( "viur-test", [ "b", "a", "c" ] )
+		oldCaching = conf[ "viur.db.caching" ]
+		conf[ "viur.db.caching" ] = 1
+		try:
+			res = db.Query( "viur-test" ).filter( "name IN", [ "a", "c" ] ).run( 10, keysOnly=True )
+		finally:
+			conf[ "viur.db.caching" ] = oldCaching
+		self.assertEqual( sorted( res ), sorted( [ keys[1], keys[2] ] ) )
+
+	def testMergeState( self ):
+		from server import db
+		cursor = db.MultiQueryCursor( [ None, False ], [ 1.5, "agx0ZXN0" ] )
+		self.assertEqual( db.MultiQueryCursor.fromUrlsafe( cursor.urlsafe() ).state, [ 1.5, "agx0ZXN0" ] )
+		for state in [ "x", [ 1.5 ], [ "agx0ZXN0", 1.5 ], [ True, "agx0ZXN0" ], { "a": 1 } ]:
+			cursor = db.MultiQueryCursor( [ None, False ], state )
+			self.assertRaises( db.BadValueError, db.MultiQueryCursor.fromUrlsafe, cursor.urlsafe() )
+		self.assertRaises( db.BadValueError, db.MultiQueryCursor.fromUrlsafe, "mq.WzFd" ) # "[1]"
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+	Tests for server.indexes, see :mod:`server.tests.test_db` on how to run them.
+"""
+import unittest
+from google.appengine.ext import testbed
+
+
+class IndexMannagerTest( unittest.TestCase ):
+	"""
+		Indexes are built in a deferred task, only the first page is served until then.
+	"""
+
+	def setUp( self ):
+		self.testbed = testbed.Testbed()
+		self.testbed.activate()
+		self.testbed.init_datastore_v3_stub()
+		self.testbed.init_memcache_stub()
+		self.testbed.init_taskqueue_stub()
+		self.taskqueue = self.testbed.get_stub( testbed.TASKQUEUE_SERVICE_NAME )
+
+	def tearDown( self ):
+		self.testbed.deactivate()
+
+	def _countTasks( self ):
+		return( len( self.taskqueue.get_filtered_tasks() ) )
+
+	def testScheduleBuild( self ):
+		from server import db
+		from server.indexes import IndexMannager
+		query = db.Query( "viur-test" ).filter( "name =", "a" ).order( "creationdate" )
+		self.assertEqual( IndexMannager().cursorForQuery( query, 2 ), None )
+		self.assertEqual( self._countTasks(), 1 )
+
+	def testMultiQuery( self ):
+		from server import db
+		from server.indexes import IndexMannager
+		indexMannager = IndexMannager()
+		for query in [ db.Query( "viur-test" ).filter( "name IN", [ "a", "b" ] ),
+				db.Query( "viur-test" ).filter( "name !=", "a" ) ]:
+			self.assertEqual( indexMannager.getPages( query ), [ None ] )
+			self.assertEqual( indexMannager.cursorForQuery( query, 2 ), None )
+			indexMannager.refreshIndex( query )
+		self.assertEqual( self._countTasks(), 0 )
+
+
+if __name__ == '__main__':
+	unittest.main()